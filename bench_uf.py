@@ -0,0 +1,264 @@
+"""
+Benchmarks of the UF reader.
+
+Synthetic UF files with a configurable number of rays, gates, fields and
+record padding are generated and read in stages: UFFile construction, ray
+decoding, field data extraction, the header getters, read_uf_arrays and a
+complete read_uf.  The time, throughput and peak Python memory of each
+stage is reported.  Peak memory is measured using tracemalloc, pages of
+memory mapped files are not included.
+
+Usage::
+
+    python bench_uf.py --nrays 3600 --ngates 1200 --nfields 8 --padding 4
+    python bench_uf.py --filename volume.uf --repeat 5
+
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+
+import numpy as np
+
+import uffile
+
+
+# two character data types of the synthetic fields
+_DATA_TYPES = ['DZ', 'VR', 'SW', 'ZD', 'PH', 'RH', 'KD', 'CZ', 'VE', 'LH',
+               'DR', 'SQ', 'NC', 'ZH', 'ZV', 'PC']
+
+
+def make_synthetic_uf(filename, nrays=720, ngates=1000, nfields=6,
+                      nsweeps=2, padding=4, seed=0):
+    """
+    Write a synthetic UF file.
+
+    The volume contains sweeps at increasing fixed angles, each a full
+    rotation in azimuth, with random field data of which about 10% of the
+    gates are missing.
+
+    Parameters
+    ----------
+    filename : str or file-like
+        Filename or file-like object to write the UF data to.
+    nrays, ngates, nfields : int, optional
+        Number of rays, gates in each ray and fields in the volume.  A
+        record of a ray may not exceed 65534 bytes.
+    nsweeps : int, optional
+        Number of sweeps, the rays are divided evenly between the sweeps.
+    padding : 0, 2 or 4, optional
+        Size of the padding in bytes before and after each record.
+    seed : int, optional
+        Seed of the random number generator used for the field data.
+
+    """
+    if nfields > len(_DATA_TYPES):
+        raise ValueError('nfields cannot exceed %d' % (len(_DATA_TYPES)))
+    random_state = np.random.RandomState(seed)
+    ray_sweep = np.arange(nrays) * nsweeps // nrays
+    first_ray = np.searchsorted(ray_sweep, ray_sweep)
+    ray_number = np.arange(nrays) - first_ray
+    rays_in_sweep = np.bincount(ray_sweep)[ray_sweep]
+
+    headers = np.zeros((nrays, ), dtype=uffile.UF_MANDATORY_HEADER_DTYPE)
+    headers['record_number'] = np.arange(1, nrays + 1)
+    headers['volume_number'] = 1
+    headers['ray_number'] = ray_number + 1
+    headers['ray_record_number'] = 1
+    headers['sweep_number'] = ray_sweep + 1
+    headers['radar_name'] = b'SYNTH'
+    headers['site_name'] = b'BENCH'
+    headers['latitude_degrees'] = 36
+    headers['latitude_minutes'] = 36
+    headers['longitude_degrees'] = -97
+    headers['longitude_minutes'] = -29
+    headers['height_above_sea_level'] = 320
+    seconds = np.arange(nrays) // 10
+    headers['year'] = 14
+    headers['month'] = 5
+    headers['day'] = 20
+    headers['hour'] = 12 + seconds // 3600
+    headers['minute'] = seconds // 60 % 60
+    headers['second'] = seconds % 60
+    headers['time_zone'] = b'UT'
+    headers['azimuth'] = np.round(360. * ray_number / rays_in_sweep * 64.)
+    headers['elevation'] = (ray_sweep + 0.5) * 64
+    headers['sweep_mode'] = 1
+    headers['fixed_angle'] = (ray_sweep + 0.5) * 64
+    headers['sweep_rate'] = 18 * 64
+    headers['generation_year'] = 14
+    headers['generation_month'] = 5
+    headers['generation_day'] = 20
+    headers['generation_facility_name'] = b'BENCH'
+    headers['missing_data_value'] = -32768
+
+    field_headers = np.zeros(
+        (nrays, nfields), dtype=uffile.UF_FIELD_HEADER_VEL_DTYPE)
+    field_headers['scale_factor'] = 100
+    field_headers['range_start_m'] = 125
+    field_headers['range_spacing_m'] = 250
+    field_headers['sample_size'] = 64
+    field_headers['pulse_width_m'] = 150
+    field_headers['beam_width_h'] = 64
+    field_headers['beam_width_v'] = 64
+    field_headers['wavelength_cm'] = 10 * 64
+    field_headers['prt_ms'] = 1000
+    field_headers['threshold_data'] = b'  '
+    field_headers['threshold_value'] = -32768
+    field_headers['scale'] = -32768
+    field_headers['edit_code'] = b'  '
+    field_headers['bits_per_bin'] = 16
+    field_headers['nyquist'] = 2500
+
+    raw_data = random_state.randint(
+        -3000, 7000, size=(nfields, nrays, ngates)).astype('int16')
+    raw_data[random_state.random_sample(raw_data.shape) < 0.1] = -32768
+    uffile.write_uf_records(filename, headers, _DATA_TYPES[:nfields],
+                            field_headers, raw_data, padding)
+
+
+def run_benchmarks(filename, repeat=3):
+    """
+    Benchmark reading a UF file.
+
+    Parameters
+    ----------
+    filename : str
+        UF file to read.
+    repeat : int, optional
+        Number of times each stage is run, the fastest time is reported.
+
+    Returns
+    -------
+    results : list of dict
+        Stage name, time in seconds, throughput in MB/s and rays/s and peak
+        memory in MB of each stage.  Stages which cannot be run, for example
+        read_uf when Py-ART is not installed, are not included.
+
+    """
+    nbytes = os.path.getsize(filename)
+    ufile = uffile.UFFile(filename)
+    nrays = ufile.nrays
+    nfields = len(ufile.field_is_read)
+
+    def decode_rays():
+        for ray in ufile.iter_rays():
+            for i in range(nfields):
+                ray.get_field_data(i)
+
+    def stream_rays():
+        for ray in uffile.iter_uf_rays(filename):
+            for i in range(nfields):
+                ray.get_field_data(i)
+
+    def get_field_data():
+        for i in range(nfields):
+            ufile.get_field_data(i)
+
+    def header_getters():
+        ufile.get_azimuths()
+        ufile.get_elevations()
+        ufile.get_sweep_rates()
+        ufile.get_pulse_widths()
+        ufile.get_prts()
+        ufile.get_nyquists()
+        ufile.get_sweep_fixed_angles()
+        ufile.get_sweep_polarizations()
+        ufile.get_datetimes()
+
+    stages = [
+        ('UFFile', lambda: uffile.UFFile(filename)),
+        ('UFFile (no mmap)', lambda: uffile.UFFile(filename, use_mmap=False)),
+        ('UFRay decoding', decode_rays),
+        ('iter_uf_rays', stream_rays),
+        ('get_field_data', get_field_data),
+        ('header getters', header_getters),
+        ('read_uf_arrays', lambda: uffile.read_uf_arrays(filename)),
+    ]
+    try:
+        import pyart    # uf only imports Py-ART when read_uf is called
+    except ImportError:
+        pass
+    else:
+        import uf
+        stages.append(('read_uf', lambda: uf.read_uf(filename)))
+
+    results = []
+    for name, func in stages:
+        elapsed, peak = _measure(func, repeat)
+        results.append({
+            'stage': name,
+            'time': elapsed,
+            'mb_per_sec': nbytes / elapsed / 1.e6,
+            'rays_per_sec': nrays / elapsed,
+            'peak_mb': peak / 1.e6,
+        })
+    return results
+
+
+def _measure(func, repeat):
+    """ Return the fastest time and peak memory of a number of calls. """
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times), peak
+
+
+def _print_results(results, out=sys.stdout):
+    """ Print a table of benchmark results. """
+    out.write('%-18s %10s %10s %12s %10s\n' % (
+        'stage', 'time (s)', 'MB/s', 'rays/s', 'peak MB'))
+    for result in results:
+        out.write('%-18s %10.4f %10.1f %12.0f %10.1f\n' % (
+            result['stage'], result['time'], result['mb_per_sec'],
+            result['rays_per_sec'], result['peak_mb']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark reading synthetic or existing UF files.')
+    parser.add_argument('--filename', help='UF file to benchmark, a '
+                        'synthetic file is generated when not provided')
+    parser.add_argument('--nrays', type=int, default=720)
+    parser.add_argument('--ngates', type=int, default=1000)
+    parser.add_argument('--nfields', type=int, default=6)
+    parser.add_argument('--nsweeps', type=int, default=2)
+    parser.add_argument('--padding', type=int, default=4, choices=[0, 2, 4])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', help='file to write the results to, for '
+                        'comparison between versions')
+    args = parser.parse_args(argv)
+
+    tmpdir = None
+    filename = args.filename
+    if filename is None:
+        tmpdir = tempfile.mkdtemp()
+        filename = os.path.join(tmpdir, 'synthetic.uf')
+        make_synthetic_uf(filename, args.nrays, args.ngates, args.nfields,
+                          args.nsweeps, args.padding)
+    try:
+        print('%s: %.1f MB' % (filename, os.path.getsize(filename) / 1.e6))
+        results = run_benchmarks(filename, args.repeat)
+    finally:
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir)
+    _print_results(results)
+    if args.json is not None:
+        with open(args.json, 'w') as fobj:
+            json.dump(results, fobj, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import asyncio
+
+import uffile
+import ufasync
+
+import numpy as np
+
+
+def _read_served_rays(data, chunk_size=1000, **kwargs):
+    """ Serve UF data over a local socket in chunks and read the rays. """
+    async def serve(reader, writer):
+        for start in range(0, len(data), chunk_size):
+            writer.write(data[start:start + chunk_size])
+            await writer.drain()
+        writer.close()
+
+    async def main():
+        server = await asyncio.start_server(serve, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        rays = [ray async for ray in ufasync.aiter_uf_rays(reader, **kwargs)]
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return rays
+
+    return asyncio.run(main())
+
+
+def test_aiter_uf_rays():
+    filename = 'sample_files/mc3e_npol_20110427_114155.uf'
+    with open(filename, 'rb') as fobj:
+        rays = _read_served_rays(fobj.read())
+    ufile = uffile.UFFile(filename)
+    assert len(rays) == ufile.nrays == 86
+    for ray, file_ray in zip(rays, ufile.rays):
+        assert ray.mandatory_header['azimuth'] == \
+            file_ray.mandatory_header['azimuth']
+        assert np.all(ray.get_field_data(1) == file_ray.get_field_data(1))
+
+
+def test_aiter_uf_rays_field_filter():
+    with open('sample_files/test.uf', 'rb') as fobj:
+        data = fobj.read()
+    rays = _read_served_rays(data,
+                             field_filter=lambda data_type: data_type == 'DZ')
+    assert len(rays) == 1
+    assert rays[0].field_raw_data[0] is not None
+    assert rays[0].field_raw_data[1] is None
+
+
+def test_aiter_uf_rays_truncated():
+    filename = 'sample_files/mc3e_npol_20110427_114155.uf'
+    with open(filename, 'rb') as fobj:
+        data = fobj.read()
+    ufile = uffile.UFFile(filename)
+
+    # the truncated final record is not returned
+    rays = _read_served_rays(data[:-3000])
+    assert len(rays) == ufile.nrays - 1
+    assert np.all(rays[-1].get_field_data(1) ==
+                  ufile.rays[-2].get_field_data(1))
+
+    # nor is a record which is only missing its trailing padding
+    rays = _read_served_rays(data[:-ufile.padding])
+    assert len(rays) == ufile.nrays - 1
@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+import warnings
+
+import uffile
+import ufcatalog
+
+
+def test_catalog():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        archive = os.path.join(tmp_dir, 'archive')
+        os.mkdir(archive)
+        shutil.copy('sample_files/test.uf', archive)
+        shutil.copy('sample_files/mc3e_npol_20110427_114155.uf', archive)
+        database = os.path.join(tmp_dir, 'catalog.sqlite')
+
+        # unreadable files are skipped with a warning, here a field header
+        # offset beyond the end of the record and a corrupted gzip stream
+        ufile = uffile.UFFile('sample_files/test.uf')
+        with open('sample_files/test.uf', 'rb') as fobj:
+            data = bytearray(fobj.read())
+        data_header_offset = ufile.mandatory_headers['offset_data_header'][0]
+        offset = ufile.record_offsets[0] + (data_header_offset - 1) * 2 + 8
+        data[offset:offset + 2] = b'\x7f\xff'    # offset_field_header
+        with open(os.path.join(archive, 'bad_offset.uf'), 'wb') as fobj:
+            fobj.write(data)
+        with open(os.path.join(archive, 'bad_gzip.uf.gz'), 'wb') as fobj:
+            fobj.write(b'\x1f\x8b' + b'X' * 100)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            assert ufcatalog.build_catalog(database, archive) == 2
+        assert len(caught) == 2
+        assert ufcatalog.build_catalog(database, archive) == 0
+
+        summary = ufcatalog.summarize_uf('sample_files/test.uf')
+        assert summary['radar_name'] == 'xsapr-sg'
+        assert summary['start_time'] == '2011-05-23T22:42:59'
+        assert summary['nsweeps'] == 1
+        assert summary['sweeps'][0]['fixed_angle'] == 0.5
+        assert summary['fields'][0]['data_type'] == 'DZ'
+        assert summary['fields'][0]['ngates'] == 801
+
+        paths = ufcatalog.query_catalog(
+            database, radar_name='NPOL1', start='2011-04-27T11:00',
+            end='2011-04-27T12:00')
+        assert [os.path.basename(p) for p in paths] == [
+            'mc3e_npol_20110427_114155.uf']
+        paths = ufcatalog.query_catalog(
+            database, fixed_angle=0.5, scan_type='ppi', data_type='DZ')
+        assert [os.path.basename(p) for p in paths] == ['test.uf']
+        assert ufcatalog.query_catalog(
+            database, fixed_angle=0.5, scan_type='rhi') == []
+    finally:
+        shutil.rmtree(tmp_dir)
@@ -0,0 +1,491 @@
+import io
+import os
+import bz2
+import gzip
+import subprocess
+import shutil
+import sys
+import tempfile
+
+import pyart
+import uf
+import uffile
+
+import numpy as np
+from numpy.testing import assert_raises
+
+radar = uf.read_uf('sample_files/test.uf')
+
+
+def test_read_no_mmap():
+    ufile = uffile.UFFile('sample_files/test.uf', use_mmap=False)
+    ref_ufile = uffile.UFFile('sample_files/test.uf')
+    assert np.ma.allclose(ufile.get_field_data(0), ref_ufile.get_field_data(0))
+
+
+def test_lazy_rays():
+    ufile = uffile.UFFile('sample_files/test.uf')
+    assert len(ufile.rays) == ufile.nrays
+    assert ufile.rays[0] is ufile.rays[-1]
+    assert ufile.rays[0].mandatory_header['record_length'] * 2 == 16568
+
+
+def test_delay_field_loading():
+    lazy_radar = uf.read_uf('sample_files/test.uf', delay_field_loading=True)
+    field = lazy_radar.fields['reflectivity']
+    assert isinstance(field, pyart.lazydict.LazyLoadDict)
+    assert 'data' in field._lazyload
+    assert np.ma.allclose(field['data'], radar.fields['reflectivity']['data'])
+    assert 'data' not in field._lazyload
+
+
+def test_iter_uf_rays():
+    ufile = uffile.UFFile('sample_files/test.uf')
+    rays = list(uffile.iter_uf_rays('sample_files/test.uf'))
+    assert len(rays) == ufile.nrays
+    assert np.all(rays[0].field_raw_data[0] == ufile.rays[0].field_raw_data[0])
+    assert len(list(ufile.iter_rays())) == ufile.nrays
+
+
+def test_iter_uf_rays_truncated():
+    filename = 'sample_files/mc3e_npol_20110427_114155.uf'
+    ufile = uffile.UFFile(filename)
+    with open(filename, 'rb') as fobj:
+        data = fobj.read()
+
+    # truncated in the field data and in the headers of the last record,
+    # the incomplete record is not returned, as by UFFile
+    for end in [len(data) - 100, ufile.record_offsets[85] + 20]:
+        truncated_ufile = uffile.UFFile(io.BytesIO(data[:end]))
+        rays = list(uffile.iter_uf_rays(io.BytesIO(data[:end])))
+        assert len(rays) == truncated_ufile.nrays == 85
+        assert np.all(rays[84].get_field_data(1) ==
+                      ufile.rays[84].get_field_data(1))
+
+
+def test_select_sweeps():
+    sweep_radar = uf.read_uf('sample_files/test.uf', sweeps=[0])
+    assert sweep_radar.nsweeps == 1
+    assert_raises(ValueError, uffile.UFFile, 'sample_files/test.uf',
+                  fixed_angle_range=(10, 20))
+    assert_raises(ValueError, uffile.UFFile, 'sample_files/test.uf',
+                  sweeps=[5])
+
+
+def test_field_filter():
+    ufile = uffile.UFFile('sample_files/test.uf',
+                          field_filter=lambda data_type: data_type == 'DZ')
+    assert ufile.field_is_read[0]
+    assert not ufile.field_is_read[1]
+    assert ufile.rays[0].field_raw_data[1] is None
+    assert_raises(ValueError, ufile.get_field_data, 1)
+
+
+def test_index_file():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'test.uf')
+        shutil.copy('sample_files/test.uf', filename)
+        ufile = uffile.UFFile(filename, index_file=True)
+        assert os.path.exists(filename + '.idx')
+        indexed_ufile = uffile.UFFile(filename, index_file=True)
+        assert np.all(indexed_ufile.record_offsets == ufile.record_offsets)
+        assert np.all(indexed_ufile.field_headers == ufile.field_headers)
+        assert np.ma.allclose(indexed_ufile.get_field_data(0),
+                              ufile.get_field_data(0))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_index_file_growing():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        with open('sample_files/mc3e_npol_20110427_114155.uf', 'rb') as fobj:
+            data = fobj.read()
+        filename = os.path.join(tmpdir, 'growing.uf')
+        with open(filename, 'wb') as fobj:
+            fobj.write(data[:len(data) // 2])
+
+        # the file grows after it is read but before the index is written
+        def append(stage, elapsed, nbytes, nobjects):
+            if stage == 'header decode':
+                with open(filename, 'ab') as fobj:
+                    fobj.write(data[len(data) // 2:])
+        stats = uffile.ReadStats(callback=append)
+        ufile = uffile.UFFile(filename, index_file=True, stats=stats)
+        assert ufile.nrays < 86
+        assert uffile.UFFile(filename, index_file=True).nrays == 86
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_read_uf_many():
+    filenames = ['sample_files/test.uf'] * 3
+    results = list(uf.read_uf_many(filenames, workers=2))
+    assert [filename for filename, _ in results] == filenames
+    for _, test_radar in results:
+        assert np.ma.allclose(test_radar.fields['reflectivity']['data'],
+                              radar.fields['reflectivity']['data'])
+    results = list(uf.read_uf_many(filenames, workers=2, ordered=False))
+    assert len(results) == 3
+
+
+def test_read_workers():
+    threaded_radar = uf.read_uf('sample_files/test.uf', workers=2)
+    for field in radar.fields.keys():
+        assert np.ma.allclose(threaded_radar.fields[field]['data'],
+                              radar.fields[field]['data'])
+
+
+def test_dense_field_data():
+    ufile = uffile.UFFile('sample_files/mc3e_npol_20110427_114155.uf')
+    missing_data_value = ufile.mandatory_headers['missing_data_value'][0]
+    scale_factor = ufile.field_headers['scale_factor'][0, 2]
+    for range_window, ngates in [(None, 999), ((0, 73500), 491)]:
+        # rays with 491 to 999 gates, in the window all have 491 gates
+        raw_data = np.empty((ufile.nrays, ngates), dtype='int16')
+        raw_data[:] = missing_data_value
+        for i, ray in enumerate(ufile.rays):
+            ray_data = ray.field_raw_data[2][:ngates]
+            raw_data[i, :len(ray_data)] = ray_data
+        data = ufile.get_field_data(2, range_window)
+        assert data.shape == (86, ngates)
+        assert np.all(data.mask == (raw_data == missing_data_value))
+        assert np.ma.allclose(data, raw_data / scale_factor)
+        assert np.ma.allclose(ufile.get_field_data(2, range_window, 2, 3),
+                              data[::2, ::3])
+
+
+def test_compact_rays():
+    ufile = uffile.UFFile('sample_files/test.uf')
+    ray = ufile.rays[0]
+    assert not hasattr(ray, '__dict__')
+    assert ray.mandatory_header['azimuth'] == 23035
+    stream_ray = next(uffile.iter_uf_rays('sample_files/test.uf'))
+    assert stream_ray.field_headers[1]['nyquist'] == 1684
+    assert ray.field_headers[1]['nyquist'] == 1684
+
+
+def test_ray_headers():
+    ufile = uffile.UFFile('sample_files/test.uf')
+    ray = ufile.rays[0]
+    assert 'azimuth' in ray.mandatory_header.keys()
+    assert ray.data_header.get('record_nfields') == len(ray.field_headers)
+    assert ray.field_positions[0]['data_type'] == b'DZ'
+    assert 'nyquist' not in ray.field_headers[0]
+    assert ray.field_headers[0].get('nyquist') is None
+    assert 'nyquist' in ray.field_headers[1]
+    assert_raises(KeyError, ray.field_headers[0].__getitem__, 'nyquist')
+    assert_raises(TypeError, ray.mandatory_header.pop, 'azimuth')
+
+    # the headers are views of the header tables of the file
+    ray.field_headers[1].pop('nyquist')
+    assert 'nyquist' not in ray.field_headers[1]
+    assert ufile.get_nyquists() is None
+    ray.field_headers[0]['polarization'] = 99
+    assert ufile.get_sweep_polarizations()[0] == 'elliptical'
+
+
+def test_ragged_field_data():
+    ufile = uffile.UFFile('sample_files/mc3e_npol_20110427_114155.uf')
+    raw_data, ray_offsets, ray_nbins = ufile.get_ragged_field_data(1)
+    assert len(raw_data) == ray_nbins.sum()
+    assert ray_nbins.min() < ray_nbins.max()
+    for i in [0, 40, 85]:
+        start = ray_offsets[i]
+        ray_data = raw_data[start:start + ray_nbins[i]]
+        assert np.all(ray_data == ufile.rays[i].field_raw_data[1])
+
+    sweep_data = ufile.get_sweep_field_data(1, 0)
+    sweep_ranges = ufile.get_sweep_ranges()
+    assert sweep_data.shape == (86, ray_nbins.max())
+    assert len(sweep_ranges[0]) == ray_nbins.max()
+
+
+def test_write_uf():
+    radar = uf.read_uf('sample_files/test.uf', file_field_names=True)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for padding in [0, 2, 4]:
+            filename = os.path.join(tmpdir, 'out%d.uf' % padding)
+            uf.write_uf(filename, radar, radar_field_names=True,
+                        padding=padding)
+            assert uffile.UFFile(filename).padding == padding
+            radar2 = uf.read_uf(filename, file_field_names=True)
+            assert radar2.time['units'] == radar.time['units']
+            assert np.allclose(radar2.time['data'], radar.time['data'])
+            assert np.allclose(radar2.azimuth['data'],
+                               radar.azimuth['data'])
+            assert np.allclose(radar2.range['data'], radar.range['data'])
+            for field in radar.fields.keys():
+                assert np.ma.allclose(radar2.fields[field]['data'],
+                                      radar.fields[field]['data'],
+                                      atol=0.006)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_write_uf_data_types():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'out.uf')
+        # Py-ART field names are not UF data types
+        assert_raises(ValueError, uf.write_uf, filename, radar,
+                      radar_field_names=True)
+        field_names = {'reflectivity': 'DZ', 'velocity': 'DZ'}
+        assert_raises(ValueError, uf.write_uf, filename, radar,
+                      uf_field_names=field_names)
+        assert not os.path.exists(filename)
+
+        mandatory_headers = np.zeros(1, uffile.UF_MANDATORY_HEADER_DTYPE)
+        field_headers = np.zeros((1, 1), uffile.UF_FIELD_HEADER_VEL_DTYPE)
+        raw_data = np.zeros((1, 1, 10), dtype='>i2')
+        for data_types in [['DZZ'], [b'D'], [u'D\xe9']]:
+            assert_raises(ValueError, uffile.write_uf_records, filename,
+                          mandatory_headers, data_types, field_headers,
+                          raw_data)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_update():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        full_filename = 'sample_files/mc3e_npol_20110427_114155.uf'
+        with open(full_filename, 'rb') as fobj:
+            data = fobj.read()
+        filename = os.path.join(tmpdir, 'growing.uf')
+
+        # the file cannot be opened until the first record is complete
+        for size in [0, 100]:
+            with open(filename, 'wb') as fobj:
+                fobj.write(data[:size])
+            assert_raises(IOError, uffile.UFFile, filename)
+
+        with open(filename, 'wb') as fobj:
+            fobj.write(data[:len(data) // 3])
+        ufile = uffile.UFFile(filename)
+        nrays = ufile.nrays
+        assert ufile.update() == 0
+
+        # append the remaining data including a partial record
+        with open(filename, 'ab') as fobj:
+            fobj.write(data[len(data) // 3:-100])
+        nrays += ufile.update()
+        assert ufile.nrays == nrays == 85
+        with open(filename, 'ab') as fobj:
+            fobj.write(data[-100:])
+        assert ufile.update() == 1
+
+        full_ufile = uffile.UFFile(full_filename)
+        assert ufile.nrays == len(ufile.rays) == 86
+        assert np.all(ufile.record_offsets == full_ufile.record_offsets)
+        assert np.all(ufile.field_headers == full_ufile.field_headers)
+        assert np.all(ufile.first_ray_in_sweep ==
+                      full_ufile.first_ray_in_sweep)
+        assert np.all(ufile.last_ray_in_sweep ==
+                      full_ufile.last_ray_in_sweep)
+        assert np.ma.allclose(ufile.get_field_data(1),
+                              full_ufile.get_field_data(1))
+        assert np.all(ufile.rays[85].get_field_data(1) ==
+                      full_ufile.rays[85].get_field_data(1))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_compressed():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        with open('sample_files/test.uf', 'rb') as fobj:
+            data = fobj.read()
+        for ext, compress in [('gz', gzip.compress), ('bz2', bz2.compress)]:
+            filename = os.path.join(tmpdir, 'test.uf.' + ext)
+            with open(filename, 'wb') as fobj:
+                fobj.write(compress(data))
+            ufile = uffile.UFFile(filename)
+            assert ufile.compression == {'gz': 'gzip', 'bz2': 'bz2'}[ext]
+            assert ufile.nrays == 1
+            with open(filename, 'rb') as fobj:
+                fobj_ufile = uffile.UFFile(fobj)
+            assert fobj_ufile.compression == ufile.compression
+            assert np.all(fobj_ufile.record_offsets == ufile.record_offsets)
+            compressed_radar = uf.read_uf(filename)
+            for field in radar.fields.keys():
+                assert np.ma.allclose(compressed_radar.fields[field]['data'],
+                                      radar.fields[field]['data'])
+            rays = list(uffile.iter_uf_rays(filename))
+            assert rays[0].mandatory_header['azimuth'] == 23035
+            assert_raises(ValueError, ufile.update)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_synthetic_uf():
+    import bench_uf
+    for padding in [0, 2, 4]:
+        fobj = io.BytesIO()
+        bench_uf.make_synthetic_uf(fobj, nrays=40, ngates=50, nfields=3,
+                                   nsweeps=2, padding=padding)
+        fobj.seek(0)
+        ufile = uffile.UFFile(fobj)
+        assert ufile.padding == padding
+        assert ufile.nrays == 40
+        assert ufile.nsweeps == 2
+        assert ufile.get_field_data(1).shape == (40, 50)
+        assert np.allclose(ufile.get_sweep_fixed_angles(), [0.5, 1.5])
+    assert_raises(ValueError, bench_uf.make_synthetic_uf, io.BytesIO(),
+                  nrays=2, ngates=3000, nfields=16)
+
+
+def test_read_stats():
+    calls = []
+    stats = uffile.ReadStats(
+        callback=lambda stage, elapsed, nbytes, nobjects: calls.append(stage))
+    uf.read_uf('sample_files/test.uf', stats=stats)
+    for stage in ['record scan', 'header decode', 'field decode',
+                  'field scaling', 'time conversion', 'radar construction']:
+        assert stage in stats.stages
+        assert stats.stages[stage]['time'] >= 0
+    assert stats.stages['record scan']['objects'] == 1
+    assert stats.stages['field decode']['calls'] == len(radar.fields)
+    assert len(calls) == sum(s['calls'] for s in stats.stages.values())
+    assert 'field scaling' in stats.summary()
+    assert_raises(ValueError, next,
+                  uf.read_uf_many(['sample_files/test.uf'], stats=stats))
+
+
+def test_get_times():
+    ufile = uffile.UFFile('sample_files/mc3e_npol_20110427_114155.uf')
+    times = ufile.get_times()
+    assert times.dtype == np.dtype('datetime64[s]')
+    assert times[0] == np.datetime64('2011-04-27T11:41:55')
+    assert ufile.get_datetimes() == [ray.get_datetime() for ray in ufile.rays]
+
+
+def test_radar_cache():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'test.uf')
+        shutil.copy('sample_files/test.uf', filename)
+        cache = uf.RadarCache()
+        cached_radar = cache.read_uf(filename, file_field_names=True)
+        assert cache.read_uf(filename, file_field_names=True,
+                             workers=2) is cached_radar
+        assert cache.hits == 1 and cache.misses == 1
+        assert len(cache) == 1 and cache.nbytes > 0
+        assert 'DZ' in cached_radar.fields
+
+        # different field selection
+        excluded_radar = cache.read_uf(filename, file_field_names=True,
+                                       exclude_fields=['DZ'])
+        assert 'DZ' not in excluded_radar.fields
+        assert len(cache) == 2
+
+        # modified files are read again
+        mtime = os.path.getmtime(filename) + 10
+        os.utime(filename, (mtime, mtime))
+        assert cache.read_uf(filename,
+                             file_field_names=True) is not cached_radar
+        assert len(cache) == 1
+
+        # evicted by size
+        cache = uf.RadarCache(max_bytes=1)
+        cache.read_uf(filename)
+        assert len(cache) == 0 and cache.nbytes == 0
+        assert_raises(ValueError, cache.read_uf, filename,
+                      delay_field_loading=True)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_read_uf_arrays():
+    volume = uf.read_uf_arrays('sample_files/test.uf', fields=['DZ', 'VR'])
+    assert sorted(volume.fields.keys()) == ['DZ', 'VR']
+    assert volume.nrays == 1 and volume.nsweeps == 1
+    assert volume.fields['DZ'].shape == (1, volume.ngates)
+    assert np.ma.allclose(volume.fields['DZ'],
+                          radar.fields['reflectivity']['data'])
+    assert np.allclose(volume.range, radar.range['data'])
+    assert np.allclose(volume.azimuth, radar.azimuth['data'])
+    assert volume.time[0] == np.datetime64('2011-05-23T22:42:59')
+
+    # Py-ART is only imported when a Radar is created
+    code = 'import sys, uf; assert "pyart" not in sys.modules'
+    subprocess.check_call([sys.executable, '-c', code])
+
+
+def test_recover():
+    filename = 'sample_files/mc3e_npol_20110427_114155.uf'
+    ufile = uffile.UFFile(filename)
+    with open(filename, 'rb') as fobj:
+        data = fobj.read()
+    starts = ufile.record_offsets - 4     # records have 4-byte padding
+
+    # garbage between records and a truncated final record
+    bad_data = data[:starts[10]] + b'garbage' + data[starts[10]:-100]
+    recovered = uffile.UFFile(io.BytesIO(bad_data), recover=True)
+    assert recovered.nrays == 85
+    assert recovered.skipped_ranges == [
+        (starts[10], starts[10] + 7), (starts[85] + 7, len(bad_data))]
+    assert np.ma.allclose(recovered.get_field_data(1),
+                          ufile.get_field_data(1)[:85])
+
+    # corrupted record_length
+    bad_data = bytearray(data)
+    bad_data[ufile.record_offsets[3] + 2] = 0x7f
+    recovered = uffile.UFFile(io.BytesIO(bytes(bad_data)), recover=True)
+    assert recovered.nrays == 85
+    assert recovered.skipped_ranges == [(starts[3], starts[4])]
+    assert np.all(recovered.record_offsets[3:] == ufile.record_offsets[4:])
+
+
+def test_range_window_and_strides():
+    ufile = uffile.UFFile('sample_files/mc3e_npol_20110427_114155.uf')
+    full_data = ufile.get_field_data(1)
+
+    gates = ufile.get_gate_slice(1, (1000, 60000), 2)
+    assert gates == slice(7, 401, 2)    # 150 m gates starting at 0 m
+    rays, first_ray_in_sweep, last_ray_in_sweep = ufile.get_strided_rays(4)
+    assert np.all(rays == np.arange(0, 86, 4))
+    assert first_ray_in_sweep[0] == 0 and last_ray_in_sweep[0] == 21
+
+    data = ufile.get_field_data(1, (1000, 60000), ray_step=4, gate_step=2)
+    assert data.shape == (22, 197)
+    assert np.ma.allclose(data, full_data[::4, 7:401:2])
+    assert_raises(ValueError, ufile.get_field_data, 1, (1e7, 2e7))
+    assert_raises(ValueError, ufile.get_field_data, 1, None, 0)
+    assert_raises(ValueError, ufile.get_field_data, 1, None, 2.0)
+    assert_raises(ValueError, ufile.get_field_data, 1, None, 1, 2.0)
+    assert_raises(ValueError, ufile.get_strided_rays, 2.0)
+    gates = ufile.get_gate_slice(1, None, np.int16(2))
+    assert gates == slice(0, 999, 2) and type(gates.step) is int
+
+    radar = uf.read_uf('sample_files/mc3e_npol_20110427_114155.uf',
+                       file_field_names=True, range_window=(0, 150000),
+                       ray_step=4, gate_step=4)
+    assert radar.nrays == 22 and radar.ngates == 250
+    assert radar.range['data'][-1] == 149400.
+    assert radar.range['meters_between_gates'] == 600
+    assert radar.sweep_end_ray_index['data'][0] == 21
+    assert radar.azimuth['data'].shape == (22, )
+    assert np.ma.allclose(radar.fields['DZ']['data'], full_data[::4, :997:4])
+
+    # the spacing of widely strided gates does not overflow the int16 header
+    radar = uf.read_uf('sample_files/mc3e_npol_20110427_114155.uf',
+                       file_field_names=True, gate_step=250)
+    assert radar.range['meters_between_gates'] == 37500
+
+
+def test_different_field_layouts():
+    filename = 'sample_files/mc3e_npol_20110427_114155.uf'
+    ufile = uffile.UFFile(filename)
+    with open(filename, 'rb') as fobj:
+        data = bytearray(fobj.read())
+
+    # a ray with fewer fields than the first ray
+    data_header_offset = ufile.mandatory_headers['offset_data_header'][15]
+    offset = ufile.record_offsets[15] + (data_header_offset - 1) * 2 + 4
+    data[offset:offset + 2] = b'\x00\x01'     # record_nfields
+    assert_raises(IOError, uffile.UFFile, io.BytesIO(bytes(data)))
+    rays = list(uffile.iter_uf_rays(io.BytesIO(bytes(data))))
+    assert len(rays[15].field_positions) == 1
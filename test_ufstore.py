@@ -0,0 +1,43 @@
+import os
+import shutil
+import tempfile
+
+import uffile
+import ufstore
+
+import numpy as np
+from numpy.testing import assert_raises
+
+
+def test_columnar_store():
+    filename = 'sample_files/mc3e_npol_20110427_114155.uf'
+    ufile = uffile.UFFile(filename)
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        directory = os.path.join(tmp_dir, 'volume.ufstore')
+        ufstore.convert_uf(filename, directory)
+        store = ufstore.UFStore(directory)
+        assert store.nrays == ufile.nrays
+        assert store.nsweeps == ufile.nsweeps
+        assert store.data_types[1] == 'DZ'
+        raw_data = store.get_sweep_raw_field_data(1, 0)
+        assert isinstance(raw_data, np.memmap)
+        assert np.all(raw_data == ufile.get_sweep_raw_field_data(1, 0))
+        assert np.ma.allclose(store.get_sweep_field_data(1, 0),
+                              ufile.get_sweep_field_data(1, 0))
+        assert np.ma.allclose(store.get_field_data(2),
+                              ufile.get_field_data(2))
+        assert np.all(store.get_times() == ufile.get_times())
+        assert np.all(store.get_azimuths() == ufile.get_azimuths())
+
+        # existing stores are only replaced when requested
+        assert_raises(IOError, ufstore.convert_uf, filename, directory)
+        ufstore.main([filename, directory, '--fields', 'VR',
+                      '--overwrite'])
+        store = ufstore.UFStore(directory)
+        assert store.field_is_stored.sum() == 1
+        assert_raises(ValueError, store.get_sweep_field_data, 1, 0)
+        assert np.ma.allclose(store.get_field_data(2),
+                              ufile.get_field_data(2))
+    finally:
+        shutil.rmtree(tmp_dir)
@@ -4,13 +4,22 @@
 
 """
 
+import os
+import datetime
+import threading
+import multiprocessing
+from collections import deque, OrderedDict
+from concurrent import futures
+
 import numpy as np
-from netCDF4 import date2num
 
-from pyart.config import FileMetadata, get_fillvalue
-from pyart.io.common import make_time_unit_str, _test_arguments
-from pyart.core.radar import Radar
-from uffile import UFFile
+from uffile import UFFile, write_uf_records, POLARIZATION_STR, _Stage
+from uffile import UF_MANDATORY_HEADER_DTYPE, UF_FIELD_HEADER_VEL_DTYPE
+from uffile import read_uf_arrays, _data_type_str, _check_data_types
+
+# Py-ART is imported by the functions which create or write Radar objects
+# so that the cost of importing it is only paid when it is needed, use
+# read_uf_arrays when a Radar object is not required.
 
 # TODO
 # * integrate into Py-ART
@@ -29,6 +38,12 @@ _UF_SWEEP_MODES = {
     7: 'idle',
 }
 
+_UF_SWEEP_MODE_NUMBERS = dict((v, k) for k, v in _UF_SWEEP_MODES.items())
+_UF_MISSING_DATA_VALUE = -32768
+
+# read_uf arguments which do not change the radar returned
+_UNCACHED_ARGUMENTS = ('index_file', 'workers', 'stats')
+
 _SWEEP_MODE_STR = {
     'calibration': 'calibration',
     'ppi': 'azimuth_surveillance',
@@ -43,14 +58,17 @@ _SWEEP_MODE_STR = {
 
 def read_uf(filename, field_names=None, additional_metadata=None,
             file_field_names=False, exclude_fields=None,
-            delay_field_loading=False, **kwargs):
+            delay_field_loading=False, sweeps=None, fixed_angle_range=None,
+            index_file=None, workers=None, stats=None, recover=False,
+            range_window=None, ray_step=1, gate_step=1, **kwargs):
     """
     Read a UF File.
 
     Parameters
     ----------
     filename : str or file-like
-        Name of Universal format file to read data from.
+        Name of Universal format file to read data from.  Gzip and bzip2
+        compressed files are decompressed as they are read.
     field_names : dict, optional
         Dictionary mapping UF data type names to radar field names. If a
         data type found in the file does not appear in this dictionary or has
@@ -71,8 +89,42 @@ def read_uf(filename, field_names=None, additional_metadata=None,
         List of fields to exclude from the radar object. This is applied
         after the `file_field_names` and `field_names` parameters.
     delay_field_loading : bool
-        This option is not implemented in the function but included for
-        compatability.
+        True to delay loading of field data from the file until the 'data'
+        key in a particular field dictionary is accessed.  In this case
+        the field attribute of the returned Radar object will contain
+        LazyLoadDict objects not dict objects.  The file remains open (or
+        in memory) until all fields have been loaded.
+    sweeps : int or sequence of int, optional
+        Indices of the sweeps to read.  Rays in other sweeps are skipped
+        without being decoded.  None, the default, reads all sweeps.
+    fixed_angle_range : (float, float), optional
+        Minimum and maximum fixed angle, in degrees, of the sweeps to read.
+        None, the default, does not select sweeps by fixed angle.
+    index_file : str or bool, optional
+        Path to an index file used to skip scanning the file on repeated
+        reads, True will use the filename with '.idx' appended.  See
+        :py:class:`UFFile` for details.  None, the default, does not use an
+        index file.
+    workers : int, optional
+        Number of threads used to read and scale the field data of the
+        volume concurrently.  None, the default, reads the fields serially.
+        Not used when delay_field_loading is True.
+    stats : ReadStats, optional
+        Object in which the time spent and the amount of data processed in
+        each stage of the read is recorded, see
+        :py:class:`uffile.ReadStats`.  None, the default, does not record
+        statistics.
+    recover : bool, optional
+        True to skip corrupted or truncated records, see
+        :py:class:`UFFile`.
+    range_window : (float, float), optional
+        Minimum and maximum range, in meters, of the gates to read.  Gates
+        outside this window are not decoded.  None, the default, reads all
+        gates.
+    ray_step, gate_step : int, optional
+        Read only every ray_step-th ray of each sweep and every gate_step-th
+        gate, for example for quick-look images.  The first ray of each sweep
+        is always read.  The default, 1, reads all rays and gates.
 
     Returns
     -------
@@ -80,6 +132,11 @@ def read_uf(filename, field_names=None, additional_metadata=None,
         Radar object.
 
     """
+    from pyart.config import FileMetadata, get_fillvalue
+    from pyart.io.common import make_time_unit_str, _test_arguments
+    from pyart.core.radar import Radar
+    from pyart.lazydict import LazyLoadDict
+
     # test for non empty kwargs
     _test_arguments(kwargs)
 
@@ -88,15 +145,23 @@ def read_uf(filename, field_names=None, additional_metadata=None,
                                 file_field_names, exclude_fields)
 
     # Open UF file and get handle
-    ufile = UFFile(filename)
+    # data from fields which are not placed in the radar object is not read
+    ufile = UFFile(filename, sweeps=sweeps,
+                   fixed_angle_range=fixed_angle_range,
+                   field_filter=filemetadata.get_field_name,
+                   index_file=index_file, stats=stats, recover=recover)
     first_ray = ufile.rays[0]
-
-    # time
-    dts = ufile.get_datetimes()
-    units = make_time_unit_str(min(dts))
-    time = filemetadata('time')
-    time['units'] = units
-    time['data'] = date2num(dts, units).astype('float32')
+    rays, first_ray_in_sweep, last_ray_in_sweep = ufile.get_strided_rays(
+        ray_step)
+
+    # time, computed from the header columns of all rays at once
+    with _Stage(stats, 'time conversion') as stage:
+        times = ufile.get_times()[rays]
+        start = times.min()
+        time = filemetadata('time')
+        time['units'] = make_time_unit_str(start.astype(datetime.datetime))
+        time['data'] = (times - start).astype('float32')
+        stage.nobjects = len(times)
 
     # range
     _range = filemetadata('range')
@@ -104,12 +169,14 @@ def read_uf(filename, field_names=None, additional_metadata=None,
     # representative of the entire volume
     field_header = first_ray.field_headers[0]
     ngates = field_header['nbins']
-    start = field_header['range_start_m']
+    start = (int(field_header['range_start_km']) * 1000 +
+             int(field_header['range_start_m']))
     step = field_header['range_spacing_m']
     # this gives distances to the start of each gate, add step/2 for center
-    _range['data'] = np.arange(ngates, dtype='float32') * step + start
-    _range['meters_to_center_of_first_gate'] = start
-    _range['meters_between_gates'] = step
+    gates = ufile.get_gate_slice(0, range_window, gate_step)
+    _range['data'] = (np.arange(ngates, dtype='float32') * step + start)[gates]
+    _range['meters_to_center_of_first_gate'] = _range['data'][0]
+    _range['meters_between_gates'] = int(step) * gates.step
 
     # latitude, longitude and altitude
     latitude = filemetadata('latitude')
@@ -129,8 +196,8 @@ def read_uf(filename, field_names=None, additional_metadata=None,
     # sweep_start_ray_index, sweep_end_ray_index
     sweep_start_ray_index = filemetadata('sweep_start_ray_index')
     sweep_end_ray_index = filemetadata('sweep_end_ray_index')
-    sweep_start_ray_index['data'] = ufile.first_ray_in_sweep
-    sweep_end_ray_index['data'] = ufile.last_ray_in_sweep
+    sweep_start_ray_index['data'] = first_ray_in_sweep
+    sweep_end_ray_index['data'] = last_ray_in_sweep
 
     # sweep number
     sweep_number = filemetadata('sweep_number')
@@ -145,11 +212,11 @@ def read_uf(filename, field_names=None, additional_metadata=None,
 
     # elevation
     elevation = filemetadata('elevation')
-    elevation['data'] = ufile.get_elevations()
+    elevation['data'] = ufile.get_elevations()[rays]
 
     # azimuth
     azimuth = filemetadata('azimuth')
-    azimuth['data'] = ufile.get_azimuths()
+    azimuth['data'] = ufile.get_azimuths()[rays]
 
     # fixed_angle
     fixed_angle = filemetadata('fixed_angle')
@@ -157,39 +224,505 @@ def read_uf(filename, field_names=None, additional_metadata=None,
 
     # fields
     fields = {}
+    field_numbers = {}
     for uf_field_number, uf_field_dic in enumerate(first_ray.field_positions):
-        uf_field_name = uf_field_dic['data_type']
+        uf_field_name = _data_type_str(uf_field_dic['data_type'])
         field_name = filemetadata.get_field_name(uf_field_name)
         if field_name is None:
             continue
         field_dic = filemetadata(field_name)
-        field_dic['data'] = ufile.get_field_data(uf_field_number)
         field_dic['_FillValue'] = get_fillvalue()
+        if delay_field_loading:
+            field_dic = LazyLoadDict(field_dic)
+            data = _UFFieldDataExtractor(
+                ufile, uf_field_number, range_window, ray_step, gate_step)
+            field_dic.set_lazy('data', data)
+        else:
+            field_numbers[field_name] = uf_field_number
         fields[field_name] = field_dic
 
+    # read and scale the field data, concurrently if requested, the bulk of
+    # this work is done in NumPy which releases the GIL.
+    def get_field_data(field_number):
+        return ufile.get_field_data(
+            field_number, range_window, ray_step, gate_step)
+
+    field_names = list(field_numbers.keys())
+    uf_field_numbers = [field_numbers[name] for name in field_names]
+    if workers is None:
+        field_data = [get_field_data(i) for i in uf_field_numbers]
+    else:
+        with futures.ThreadPoolExecutor(workers) as executor:
+            field_data = list(executor.map(get_field_data, uf_field_numbers))
+    for field_name, data in zip(field_names, field_data):
+        fields[field_name]['data'] = data
+
     # instrument_parameters
-    instrument_parameters = _get_instrument_parameters(ufile, filemetadata)
+    instrument_parameters = _get_instrument_parameters(
+        ufile, filemetadata, rays)
 
     # scan rate
     scan_rate = filemetadata('scan_rate')
-    scan_rate['data'] = ufile.get_sweep_rates()
+    scan_rate['data'] = ufile.get_sweep_rates()[rays]
+
+    with _Stage(stats, 'radar construction') as stage:
+        radar = Radar(
+            time, _range, fields, metadata, scan_type,
+            latitude, longitude, altitude,
+            sweep_number, sweep_mode, fixed_angle, sweep_start_ray_index,
+            sweep_end_ray_index,
+            azimuth, elevation,
+            scan_rate=scan_rate,
+            instrument_parameters=instrument_parameters)
+        stage.nobjects = radar.nrays
+    return radar
+
+
+def read_uf_many(filenames, workers=None, ordered=True, max_pending=None,
+                 **kwargs):
+    """
+    Read many UF files concurrently using a pool of worker processes.
+
+    Parameters
+    ----------
+    filenames : iterable of str
+        Names of the Universal format files to read data from.
+    workers : int, optional
+        Number of worker processes.  None, the default, will use the number
+        of processors on the machine.
+    ordered : bool, optional
+        True to yield the radars in the order of `filenames`.  False will
+        yield each radar as soon as it has been read.
+    max_pending : int, optional
+        Maximum number of files which are being read or whose radar has not
+        yet been yielded, this bounds the memory used by the reader.  None,
+        the default, will use twice the number of workers.
+
+    Additional keyword arguments are passed to :py:func:`read_uf`,
+    delay_field_loading and stats are not supported.
+
+    Yields
+    ------
+    filename, radar : str, Radar
+        Name of the file and the Radar object read from it.
+
+    """
+    if kwargs.get('delay_field_loading', False):
+        raise ValueError('delay_field_loading is not supported')
+    if kwargs.get('stats') is not None:
+        raise ValueError('stats is not supported')
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if max_pending is None:
+        max_pending = 2 * workers
+
+    with futures.ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        filenames = iter(filenames)
+        while True:
+
+            # keep up to max_pending files being read
+            for filename in filenames:
+                future = executor.submit(read_uf, filename, **kwargs)
+                pending.append((future, filename))
+                if len(pending) >= max_pending:
+                    break
+            if not pending:
+                break
+
+            # yield the next radar in order or the first one completed
+            if ordered:
+                future, filename = pending.popleft()
+            else:
+                futures.wait([f for f, _ in pending],
+                             return_when=futures.FIRST_COMPLETED)
+                idx = [f.done() for f, _ in pending].index(True)
+                future, filename = pending[idx]
+                del pending[idx]
+            yield filename, future.result()
+
+
+class RadarCache(object):
+    """
+    A least recently used cache of Radar objects read from UF files.
+
+    Volumes are keyed by the path, size and modification time of the file
+    along with the arguments which select the fields and rays read, a file
+    which has been modified is read again.  Once the total size of the
+    arrays in the cached volumes exceeds the byte budget the least recently
+    used volumes are evicted.  The cache may be shared between threads.
+
+    The cached Radar objects are returned to every caller which reads the
+    same volume and should not be modified.
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        Maximum total size in bytes of the cached volumes.  Volumes larger
+        than this are read but not cached.
+
+    Attributes
+    ----------
+    nbytes : int
+        Total size in bytes of the cached volumes.
+    hits, misses : int
+        Number of reads which were and were not satisfied by the cache.
 
-    return Radar(
-        time, _range, fields, metadata, scan_type,
-        latitude, longitude, altitude,
-        sweep_number, sweep_mode, fixed_angle, sweep_start_ray_index,
-        sweep_end_ray_index,
-        azimuth, elevation,
-        scan_rate=scan_rate,
-        instrument_parameters=instrument_parameters)
+    """
 
+    def __init__(self, max_bytes=512 * 2 ** 20):
+        """ initialize. """
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def read_uf(self, filename, **kwargs):
+        """
+        Read a UF file, returning the cached Radar when available.
+
+        Parameters
+        ----------
+        filename : str
+            Name of Universal format file to read data from.
+
+        Additional keyword arguments are passed to :py:func:`read_uf`,
+        delay_field_loading is not supported.
+
+        Returns
+        -------
+        radar : Radar
+            Radar object, shared with other readers of the volume.
+
+        """
+        if hasattr(filename, 'read'):
+            raise ValueError('RadarCache requires a filename')
+        if kwargs.get('delay_field_loading', False):
+            raise ValueError('delay_field_loading is not supported')
+        key = _cache_key(filename, kwargs)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry    # most recently used
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        radar = read_uf(filename, **kwargs)
+        nbytes = _radar_nbytes(radar)
+        with self._lock:
+            # remove volumes from previous versions of the file
+            for stale_key in list(self._entries.keys()):
+                if stale_key[0] == key[0] and stale_key[1:3] != key[1:3]:
+                    self._evict(stale_key)
+            if nbytes <= self.max_bytes and key not in self._entries:
+                self._entries[key] = (radar, nbytes)
+                self.nbytes += nbytes
+                while self.nbytes > self.max_bytes:
+                    self._evict(next(iter(self._entries)))
+        return radar
+
+    def clear(self):
+        """ Remove all volumes from the cache. """
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def _evict(self, key):
+        """ Remove a volume from the cache. """
+        _, nbytes = self._entries.pop(key)
+        self.nbytes -= nbytes
+
+
+def _cache_key(filename, kwargs):
+    """ Return the RadarCache key of a read_uf call. """
+    stat = os.stat(filename)
+    arguments = tuple(sorted(
+        (name, _freeze(value)) for name, value in kwargs.items()
+        if name not in _UNCACHED_ARGUMENTS))
+    return (os.path.abspath(filename), stat.st_size, stat.st_mtime,
+            arguments)
+
+
+def _freeze(value):
+    """ Return a hashable version of an argument. """
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set, np.ndarray)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _radar_nbytes(radar):
+    """ Return the total size of the arrays in a Radar object. """
+    dics = [value for value in vars(radar).values()
+            if isinstance(value, dict) and 'data' in value]
+    dics.extend(radar.fields.values())
+    if radar.instrument_parameters is not None:
+        dics.extend(radar.instrument_parameters.values())
+    nbytes = 0
+    for dic in dics:
+        data = dic['data']
+        nbytes += getattr(data, 'nbytes', 0)
+        nbytes += getattr(np.ma.getmask(data), 'nbytes', 0)
+    return nbytes
+
+
+def write_uf(filename, radar, uf_field_names=None, radar_field_names=False,
+             exclude_fields=None, padding=4):
+    """
+    Write a Radar object to a UF file.
 
-def _get_instrument_parameters(ufile, filemetadata):
-    """ Return a dictionary containing instrument parameters. """
+    The headers and data of all rays are encoded at once, see
+    :py:func:`uffile.write_uf_records`.  The scale factor of each field is
+    the largest of 100, 10 or 1 which allows the field data to be
+    represented.
+
+    Parameters
+    ----------
+    filename : str or file-like
+        Filename or file-like object to write the UF data to.
+    radar : Radar
+        Radar object to write.
+    uf_field_names : dict, optional
+        Dictionary mapping radar field names to two character UF data types.
+        Fields which do not appear in this dictionary are not written.  A
+        value of None, the default, will use the inverse of the UF mapping
+        defined in the Py-ART configuration file.
+    radar_field_names : bool, optional
+        True to use the radar field names as the UF data types, in which
+        case the `uf_field_names` parameter is ignored.  The field names
+        must then be two character UF data types such as those of a radar
+        read with file_field_names=True.
+    exclude_fields : list or None, optional
+        List of radar fields to exclude from the file.
+    padding : 0, 2 or 4, optional
+        Size of the padding in bytes written before and after each record.
+
+    """
+    # determine the fields to write and their UF data types
+    if uf_field_names is None:
+        from pyart.config import get_field_mapping
+        uf_field_names = {}
+        for data_type, field_name in get_field_mapping('uf').items():
+            uf_field_names.setdefault(field_name, data_type)
+    if exclude_fields is None:
+        exclude_fields = []
+    field_names = []
+    data_types = []
+    for field_name in radar.fields.keys():
+        if field_name in exclude_fields:
+            continue
+        if radar_field_names:
+            data_type = field_name
+        else:
+            data_type = uf_field_names.get(field_name)
+        if data_type is None:
+            continue
+        field_names.append(field_name)
+        data_types.append(data_type)
+    if len(field_names) == 0:
+        raise ValueError('no fields to write to the UF file')
+    # check the data types before the headers and data are gathered
+    data_types = _check_data_types(data_types)
+
+    # sweep index of each ray
+    ray_sweep = np.searchsorted(radar.sweep_start_ray_index['data'],
+                                np.arange(radar.nrays), side='right') - 1
+
+    mandatory_headers = _get_mandatory_headers(radar, ray_sweep)
+    field_headers, raw_data = _get_field_headers_and_data(
+        radar, field_names, ray_sweep)
+    write_uf_records(filename, mandatory_headers, data_types, field_headers,
+                     raw_data, padding)
+
+
+def _get_mandatory_headers(radar, ray_sweep):
+    """ Return a record array of mandatory headers for each ray. """
+    nrays = radar.nrays
+    headers = np.zeros((nrays, ), dtype=UF_MANDATORY_HEADER_DTYPE)
+
+    headers['record_number'] = np.arange(1, nrays + 1)
+    headers['volume_number'] = 1
+    first_ray = radar.sweep_start_ray_index['data'][ray_sweep]
+    headers['ray_number'] = np.arange(nrays) - first_ray + 1
+    headers['ray_record_number'] = 1
+    headers['sweep_number'] = ray_sweep + 1
+    headers['radar_name'] = radar.metadata.get('radar_name', '')
+    headers['site_name'] = radar.metadata.get('site_name', '')
+
+    # location
+    lat_deg, lat_min, lat_sec = _degrees_minutes_seconds(
+        radar.latitude['data'][0])
+    headers['latitude_degrees'] = lat_deg
+    headers['latitude_minutes'] = lat_min
+    headers['latitude_seconds'] = lat_sec
+    lon_deg, lon_min, lon_sec = _degrees_minutes_seconds(
+        radar.longitude['data'][0])
+    headers['longitude_degrees'] = lon_deg
+    headers['longitude_minutes'] = lon_min
+    headers['longitude_seconds'] = lon_sec
+    headers['height_above_sea_level'] = np.round(radar.altitude['data'][0])
+
+    # time, UF stores the last two digits of the year
+    year, month, day, hour, minute, second = _time_components(radar.time)
+    headers['year'] = year % 100
+    headers['month'] = month
+    headers['day'] = day
+    headers['hour'] = hour
+    headers['minute'] = minute
+    headers['second'] = second
+    headers['time_zone'] = b'UT'
+
+    # angles and sweep parameters, in degrees * 64
+    headers['azimuth'] = np.round(radar.azimuth['data'] * 64.)
+    headers['elevation'] = np.round(radar.elevation['data'] * 64.)
+    headers['sweep_mode'] = _UF_SWEEP_MODE_NUMBERS.get(radar.scan_type, 6)
+    headers['fixed_angle'] = np.round(
+        radar.fixed_angle['data'][ray_sweep] * 64.)
+    if radar.scan_rate is not None:
+        headers['sweep_rate'] = np.round(radar.scan_rate['data'] * 64.)
+
+    today = datetime.date.today()
+    headers['generation_year'] = today.year % 100
+    headers['generation_month'] = today.month
+    headers['generation_day'] = today.day
+    headers['generation_facility_name'] = b'Py-ART'
+    headers['missing_data_value'] = _UF_MISSING_DATA_VALUE
+    return headers
+
+
+def _get_field_headers_and_data(radar, field_names, ray_sweep):
+    """ Return field headers and raw field data for each ray. """
+    nrays = radar.nrays
+    nfields = len(field_names)
+    headers = np.zeros((nrays, nfields), dtype=UF_FIELD_HEADER_VEL_DTYPE)
+
+    # range
+    start = radar.range['data'][0]
+    if 'meters_between_gates' in radar.range:
+        step = radar.range['meters_between_gates']
+    else:
+        step = radar.range['data'][1] - radar.range['data'][0]
+    range_start_km = int(start // 1000)
+    headers['range_start_km'] = range_start_km
+    headers['range_start_m'] = np.round(start - range_start_km * 1000)
+    headers['range_spacing_m'] = np.round(step)
+
+    # instrument parameters, left as zero when not available
+    instrument_parameters = radar.instrument_parameters
+    if instrument_parameters is None:
+        instrument_parameters = {}
+
+    def get_parameter(name):
+        if name not in instrument_parameters:
+            return None
+        return np.asarray(instrument_parameters[name]['data'])
+
+    pulse_width = get_parameter('pulse_width')
+    if pulse_width is not None:
+        headers['pulse_width_m'] = np.round(
+            pulse_width * _LIGHT_SPEED)[:, np.newaxis]
+    beam_width_h = get_parameter('radar_beam_width_h')
+    if beam_width_h is not None:
+        headers['beam_width_h'] = np.round(beam_width_h[0] * 64.)
+    beam_width_v = get_parameter('radar_beam_width_v')
+    if beam_width_v is not None:
+        headers['beam_width_v'] = np.round(beam_width_v[0] * 64.)
+    bandwidth = get_parameter('radar_receiver_bandwidth')
+    if bandwidth is not None:
+        headers['bandwidth'] = np.round(bandwidth[0] / 1.e6 * 16.)
+    polarization_mode = get_parameter('polarization_mode')
+    if polarization_mode is not None:
+        polarizations = np.array(
+            [POLARIZATION_STR.index(mode) if mode in POLARIZATION_STR else 0
+             for mode in polarization_mode])
+        headers['polarization'] = polarizations[ray_sweep, np.newaxis]
+    frequency = get_parameter('frequency')
+    if frequency is not None:
+        wavelength_cm = _LIGHT_SPEED / frequency[0] * 100.
+        headers['wavelength_cm'] = np.round(wavelength_cm * 64.)
+    prt = get_parameter('prt')
+    if prt is not None:
+        headers['prt_ms'] = np.round(prt * 1e6)[:, np.newaxis]
+    nyquist = get_parameter('nyquist_velocity')
+
+    headers['threshold_data'] = b'  '
+    headers['threshold_value'] = _UF_MISSING_DATA_VALUE
+    headers['scale'] = _UF_MISSING_DATA_VALUE
+    headers['edit_code'] = b'  '
+    headers['bits_per_bin'] = 16
+
+    # field data, scaled into 16-bit integers
+    raw_data = np.empty((nfields, nrays, radar.ngates), dtype='int16')
+    for i, field_name in enumerate(field_names):
+        scale_factor, raw_data[i] = _scale_field_data(
+            radar.fields[field_name]['data'])
+        headers['scale_factor'][:, i] = scale_factor
+        if nyquist is not None:
+            headers['nyquist'][:, i] = np.round(nyquist * scale_factor)
+    return headers, raw_data
+
+
+def _scale_field_data(data):
+    """ Return the scale factor and raw 16-bit integer data for a field. """
+    data = np.ma.masked_invalid(data)
+    max_value = 0
+    if data.count():
+        max_value = np.ma.max(np.ma.abs(data))
+    scale_factor = 100
+    while scale_factor > 1 and max_value * scale_factor > 32767:
+        scale_factor //= 10
+    raw_data = np.ma.round(data * scale_factor).clip(-32767, 32767)
+    return scale_factor, raw_data.filled(_UF_MISSING_DATA_VALUE)
+
+
+def _degrees_minutes_seconds(angle):
+    """
+    Return the degrees, minutes and seconds * 64 of an angle.
+
+    All values have the same sign as the angle.
+    """
+    degrees = int(angle)
+    minutes = int((angle - degrees) * 60.)
+    seconds = int(round(((angle - degrees) * 60. - minutes) * 60. * 64.))
+    return degrees, minutes, seconds
+
+
+def _time_components(time):
+    """ Return the year, month, day, hour, minute and second of each ray. """
+    units = time['units']
+    if not units.startswith('seconds since '):
+        raise ValueError('time units must be seconds since a date')
+    start = np.datetime64(units[len('seconds since '):].rstrip('Z'), 's')
+    seconds = np.floor(time['data']).astype('int64')
+    times = start + seconds.astype('timedelta64[s]')
+
+    years = times.astype('datetime64[Y]')
+    months = times.astype('datetime64[M]')
+    days = times.astype('datetime64[D]')
+    year = years.astype('int64') + 1970
+    month = (months - years).astype('int64') + 1
+    day = (days - months).astype('int64') + 1
+    second_of_day = (times - days).astype('int64')
+    hour = second_of_day // 3600
+    minute = second_of_day // 60 % 60
+    second = second_of_day % 60
+    return year, month, day, hour, minute, second
+
+
+def _get_instrument_parameters(ufile, filemetadata, rays):
+    """ Return a dictionary containing instrument parameters of rays. """
 
     # pulse width
     pulse_width = filemetadata('pulse_width')
-    pulse_width['data'] = ufile.get_pulse_widths() / _LIGHT_SPEED  # m->sec
+    pulse_width['data'] = (
+        ufile.get_pulse_widths()[rays] / _LIGHT_SPEED)  # m->sec
 
     # assume that the parameters in the first ray represent the beam widths,
     # bandwidth and frequency in the entire volume
@@ -223,7 +756,7 @@ def _get_instrument_parameters(ufile, filemetadata):
 
     # prt
     prt = filemetadata('prt')
-    prt['data'] = ufile.get_prts() / 1e6  # us->sec
+    prt['data'] = ufile.get_prts()[rays] / 1e6  # us->sec
 
     instrument_parameters = {
         'pulse_width': pulse_width,
@@ -239,6 +772,40 @@ def _get_instrument_parameters(ufile, filemetadata):
     nyquist_velocity = filemetadata('nyquist_velocity')
     nyquist_velocity['data'] = ufile.get_nyquists()
     if nyquist_velocity['data'] is not None:
+        nyquist_velocity['data'] = nyquist_velocity['data'][rays]
         instrument_parameters['nyquist_velocity'] = nyquist_velocity
 
     return instrument_parameters
+
+
+class _UFFieldDataExtractor(object):
+    """
+    Class facilitating on demand extraction of field data from a UF file.
+
+    Parameters
+    ----------
+    ufile : UFFile
+        UFFile object from which the field data will be extracted.
+    field_number : int
+        Index of the field in the UF file.
+    range_window : (float, float) or None
+        Minimum and maximum range of the gates to extract.
+    ray_step, gate_step : int
+        Step between the rays and gates which are extracted.
+
+    """
+
+    def __init__(self, ufile, field_number, range_window=None, ray_step=1,
+                 gate_step=1):
+        """ initialize the object. """
+        self.ufile = ufile
+        self.field_number = field_number
+        self.range_window = range_window
+        self.ray_step = ray_step
+        self.gate_step = gate_step
+
+    def __call__(self):
+        """ Return the field data. """
+        return self.ufile.get_field_data(
+            self.field_number, self.range_window, self.ray_step,
+            self.gate_step)
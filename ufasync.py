@@ -0,0 +1,67 @@
+"""
+Asynchronous reading of Universal Format (UF) records from a stream.
+
+The coroutines in this module use the async/await syntax and require
+Python 3.6 or later, they are kept separate from the uffile module for this
+reason.
+
+"""
+
+import asyncio
+
+from uffile import UFRay, _find_padding, _record_size
+
+
+async def aiter_uf_rays(reader, field_filter=None):
+    """
+    Asynchronously iterate over the rays in a stream of UF records.
+
+    Records are read from the stream as they arrive and converted into UFRay
+    objects, which allows rays pushed over a network connection to be
+    processed without first buffering the complete volume to disk.  Use
+    with ``async for ray in aiter_uf_rays(reader)``.
+
+    Parameters
+    ----------
+    reader : asyncio.StreamReader
+        Stream containing UF records, including any padding around each
+        record.  Iteration stops when the end of the stream is reached, a
+        truncated final record is not returned.
+    field_filter : callable, optional
+        Function called with the data type of each field, as a str, data
+        from fields for which a false value is returned is not read.  None,
+        the default, will read all fields.
+
+    Yields
+    ------
+    ray : UFRay
+        Ray from the UF stream.
+
+    """
+    # determine padding around records
+    buf = await _read(reader, 8)
+    padding = _find_padding(buf)
+
+    while len(buf) == 8:  # read until end of stream reached
+
+        # read in full record
+        record_size = _record_size(buf, padding)
+        bytes_read = len(buf) - padding
+        record = buf[padding:] + await _read(reader, record_size - bytes_read)
+
+        # read post record padding, stop if the stream ended in the record
+        post_padding = await _read(reader, padding)
+        if len(record) != record_size or len(post_padding) != padding:
+            break
+        yield UFRay(record, field_filter)
+
+        # read in the first eight bytes of the next record
+        buf = await _read(reader, 8)
+
+
+async def _read(reader, nbytes):
+    """ Read bytes from a stream, fewer are returned only at its end. """
+    try:
+        return await reader.readexactly(nbytes)
+    except asyncio.IncompleteReadError as error:
+        return error.partial
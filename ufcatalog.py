@@ -0,0 +1,398 @@
+"""
+Header-only catalog of UF archives in SQLite.
+
+Only the mandatory header of each record and the optional, data and field
+headers of the first record are read when a file is cataloged, no field
+data is decoded.  The catalog contains three tables:
+
+* volumes : path, size, mtime, radar_name, site_name, project_name,
+  latitude, longitude, altitude, start_time, end_time, nrays, nsweeps and
+  scan_type of each file.
+* sweeps : path, sweep, sweep_number, fixed_angle, scan_type, nrays,
+  start_time and end_time of each sweep in a file.
+* fields : path, field, data_type, ngates, range_start_m and
+  range_spacing_m of each field in a file.
+
+Times are stored as ISO 8601 strings, 'YYYY-MM-DDTHH:MM:SS'.
+
+Usage::
+
+    python ufcatalog.py build catalog.sqlite /data/npol
+    python ufcatalog.py query catalog.sqlite --radar-name npol1 \\
+        --start 2011-04-27T11:00 --end 2011-04-27T12:00 \\
+        --fixed-angle 0.5 --scan-type ppi
+
+"""
+
+import os
+import mmap
+import zlib
+import struct
+import fnmatch
+import sqlite3
+import argparse
+import warnings
+from contextlib import closing
+
+import numpy as np
+
+from uf import _UF_SWEEP_MODES
+from uffile import UF_MANDATORY_HEADER_DTYPE, UF_OPTIONAL_HEADER_DTYPE
+from uffile import _get_compression, _decompress, _find_padding
+from uffile import _scan_records, _unpack_table, _decode_headers
+from uffile import _sweep_limits, _byte_offset, _data_type_str
+from uffile import _header_datetime64, _header_location
+
+
+_CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS volumes (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    radar_name TEXT,
+    site_name TEXT,
+    project_name TEXT,
+    latitude REAL,
+    longitude REAL,
+    altitude REAL,
+    start_time TEXT,
+    end_time TEXT,
+    nrays INTEGER,
+    nsweeps INTEGER,
+    scan_type TEXT
+);
+CREATE TABLE IF NOT EXISTS sweeps (
+    path TEXT,
+    sweep INTEGER,
+    sweep_number INTEGER,
+    fixed_angle REAL,
+    scan_type TEXT,
+    nrays INTEGER,
+    start_time TEXT,
+    end_time TEXT
+);
+CREATE TABLE IF NOT EXISTS fields (
+    path TEXT,
+    field INTEGER,
+    data_type TEXT,
+    ngates INTEGER,
+    range_start_m REAL,
+    range_spacing_m REAL
+);
+CREATE INDEX IF NOT EXISTS volumes_start_time ON volumes (start_time);
+CREATE INDEX IF NOT EXISTS sweeps_path ON sweeps (path);
+CREATE INDEX IF NOT EXISTS fields_path ON fields (path);
+"""
+
+# errors raised when summarizing a corrupted, truncated or non-UF file
+_READ_ERRORS = (IOError, ValueError, IndexError, struct.error, zlib.error)
+
+
+def summarize_uf(filename):
+    """
+    Summarize a UF file from its headers.
+
+    Parameters
+    ----------
+    filename : str
+        Filename of a UF file, gzip or bzip2 compressed files are
+        decompressed in memory.
+
+    Returns
+    -------
+    summary : dict
+        Summary of the volume with the columns of the volumes table and
+        'sweeps' and 'fields' keys containing lists of dictionaries with the
+        columns of the sweeps and fields tables.
+
+    """
+    with open(filename, 'rb') as fobj:
+        stat = os.fstat(fobj.fileno())
+        compression = _get_compression(fobj.read(3))
+        fobj.seek(0)
+        if compression is not None:
+            buf = _decompress(fobj, compression)
+        elif stat.st_size != 0:
+            buf = mmap.mmap(fobj.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            buf = b''
+
+    # follow the record_length chain reading only the mandatory header of
+    # each record, the remaining headers are read from the first record.
+    padding = _find_padding(buf)
+    record_offsets, _ = _scan_records(buf, padding)
+    if len(record_offsets) == 0:
+        raise IOError('file contains no complete records')
+    record_offsets = np.array(record_offsets, dtype='int64')
+    mandatory_headers = _unpack_table(
+        buf, record_offsets, UF_MANDATORY_HEADER_DTYPE)
+    first = _decode_headers(buf, record_offsets[:1], mandatory_headers[:1])
+    first_header = mandatory_headers[0]
+    project_name = None
+    if first_header['offset_optional_header'] != 0:
+        offset = (record_offsets[0] +
+                  _byte_offset(first_header['offset_optional_header']))
+        optional_header = _unpack_table(
+            buf, offset, UF_OPTIONAL_HEADER_DTYPE)[()]
+        project_name = _header_str(optional_header['project_name'])
+
+    times = _header_datetime64(mandatory_headers)
+    sweep_numbers = mandatory_headers['sweep_number']
+    first_ray_in_sweep, last_ray_in_sweep = _sweep_limits(sweep_numbers)
+    sweeps = []
+    for sweep, (first_ray, last_ray) in enumerate(
+            zip(first_ray_in_sweep, last_ray_in_sweep)):
+        sweep_header = mandatory_headers[first_ray]
+        sweep_times = times[first_ray:last_ray + 1]
+        sweeps.append({
+            'sweep': sweep,
+            'sweep_number': int(sweep_header['sweep_number']),
+            'fixed_angle': float(sweep_header['fixed_angle'] / 64.),
+            'scan_type': _scan_type(sweep_header['sweep_mode']),
+            'nrays': int(last_ray - first_ray + 1),
+            'start_time': _time_str(sweep_times.min()),
+            'end_time': _time_str(sweep_times.max()),
+        })
+
+    fields = []
+    field_headers = first['field_headers'][0]
+    for field, position in enumerate(first['field_positions'][0]):
+        field_header = field_headers[field]
+        fields.append({
+            'field': field,
+            'data_type': _data_type_str(position['data_type']),
+            'ngates': int(field_header['nbins']),
+            'range_start_m': float(field_header['range_start_km'] * 1000. +
+                                   field_header['range_start_m']),
+            'range_spacing_m': float(field_header['range_spacing_m']),
+        })
+
+    latitude, longitude, altitude = _header_location(first_header)
+    return {
+        'path': os.path.abspath(filename),
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'radar_name': _header_str(first_header['radar_name']),
+        'site_name': _header_str(first_header['site_name']),
+        'project_name': project_name,
+        'latitude': float(latitude),
+        'longitude': float(longitude),
+        'altitude': float(altitude),
+        'start_time': _time_str(times.min()),
+        'end_time': _time_str(times.max()),
+        'nrays': len(record_offsets),
+        'nsweeps': len(sweeps),
+        'scan_type': _scan_type(first_header['sweep_mode']),
+        'sweeps': sweeps,
+        'fields': fields,
+    }
+
+
+def build_catalog(database, paths, pattern='*'):
+    """
+    Add UF files to a catalog, creating the catalog if needed.
+
+    Parameters
+    ----------
+    database : str
+        Filename of the SQLite catalog.
+    paths : str or list of str
+        UF files and directories to add, directories are searched
+        recursively.
+    pattern : str, optional
+        Shell-style pattern which the names of files found in directories
+        must match.
+
+    Returns
+    -------
+    ncataloged : int
+        Number of files added or updated.  Files whose size and
+        modification time are unchanged since they were cataloged are not
+        read again, files which cannot be read are skipped with a warning.
+
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    ncataloged = 0
+    with closing(sqlite3.connect(database)) as connection:
+        connection.executescript(_CATALOG_SCHEMA)
+        for filename in _find_files(paths, pattern):
+            path = os.path.abspath(filename)
+            try:
+                stat = os.stat(path)
+                row = connection.execute(
+                    'SELECT size, mtime FROM volumes WHERE path = ?',
+                    (path, )).fetchone()
+                if row is not None and tuple(row) == (
+                        stat.st_size, stat.st_mtime):
+                    continue
+                summary = summarize_uf(path)
+            except _READ_ERRORS as error:
+                warnings.warn('skipping %s: %s' % (path, error))
+                continue
+            with connection:
+                _insert_summary(connection, summary)
+            ncataloged += 1
+    return ncataloged
+
+
+def query_catalog(database, radar_name=None, site_name=None, start=None,
+                  end=None, fixed_angle=None, scan_type=None, data_type=None,
+                  angle_tolerance=0.1):
+    """
+    Return the paths of the cataloged volumes which match all criteria.
+
+    Parameters
+    ----------
+    database : str
+        Filename of the SQLite catalog.
+    radar_name, site_name : str, optional
+        Radar and site name of the volumes, compared case-insensitively.
+    start, end : str or datetime, optional
+        Start and end of a period, volumes which overlap the period match.
+    fixed_angle : float, optional
+        Fixed angle in degrees of a sweep in the volume.
+    scan_type : str, optional
+        Scan type of a sweep in the volume, 'ppi', 'rhi', etc.  When both
+        fixed_angle and scan_type are given the same sweep must match both.
+    data_type : str, optional
+        UF data type of a field in the volume.
+    angle_tolerance : float, optional
+        Tolerance in degrees when matching fixed_angle.
+
+    Returns
+    -------
+    paths : list of str
+        Paths of the matching volumes ordered by start time.
+
+    """
+    conditions = []
+    parameters = []
+    if radar_name is not None:
+        conditions.append('radar_name = ? COLLATE NOCASE')
+        parameters.append(radar_name)
+    if site_name is not None:
+        conditions.append('site_name = ? COLLATE NOCASE')
+        parameters.append(site_name)
+    if start is not None:
+        conditions.append('end_time >= ?')
+        parameters.append(_time_str(start))
+    if end is not None:
+        conditions.append('start_time <= ?')
+        parameters.append(_time_str(end))
+
+    sweep_conditions = []
+    if fixed_angle is not None:
+        sweep_conditions.append('ABS(fixed_angle - ?) <= ?')
+        parameters.extend([fixed_angle, angle_tolerance])
+    if scan_type is not None:
+        sweep_conditions.append('scan_type = ?')
+        parameters.append(scan_type)
+    if sweep_conditions:
+        conditions.append('path IN (SELECT path FROM sweeps WHERE %s)' % (
+            ' AND '.join(sweep_conditions)))
+    if data_type is not None:
+        conditions.append(
+            'path IN (SELECT path FROM fields WHERE data_type = ?)')
+        parameters.append(data_type)
+
+    query = 'SELECT path FROM volumes'
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY start_time, path'
+    with closing(sqlite3.connect(database)) as connection:
+        connection.executescript(_CATALOG_SCHEMA)
+        return [row[0] for row in connection.execute(query, parameters)]
+
+
+def _find_files(paths, pattern):
+    """ Yield the files in paths and those in directories matching pattern. """
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for filename in sorted(fnmatch.filter(filenames, pattern)):
+                yield os.path.join(dirpath, filename)
+
+
+def _insert_summary(connection, summary):
+    """ Replace the rows of a volume in the catalog with a summary. """
+    path = summary['path']
+    for table in ('volumes', 'sweeps', 'fields'):
+        connection.execute('DELETE FROM %s WHERE path = ?' % (table),
+                           (path, ))
+    volume = dict((key, value) for key, value in summary.items()
+                  if key not in ('sweeps', 'fields'))
+    _insert_row(connection, 'volumes', volume)
+    for sweep in summary['sweeps']:
+        _insert_row(connection, 'sweeps', dict(sweep, path=path))
+    for field in summary['fields']:
+        _insert_row(connection, 'fields', dict(field, path=path))
+
+
+def _insert_row(connection, table, row):
+    """ Insert a row, a dictionary of column values, into a table. """
+    columns = sorted(row)
+    connection.execute(
+        'INSERT INTO %s (%s) VALUES (%s)' % (
+            table, ', '.join(columns), ', '.join('?' * len(columns))),
+        [row[column] for column in columns])
+
+
+def _header_str(value):
+    """ Return a space or null padded header string as a str. """
+    return value.decode('ascii', 'replace').strip('\x00 ')
+
+
+def _scan_type(sweep_mode):
+    """ Return the scan type of a UF sweep_mode. """
+    return _UF_SWEEP_MODES.get(int(sweep_mode), 'manual')
+
+
+def _time_str(time):
+    """ Return a datetime, datetime64 or time string as an ISO string. """
+    return str(np.datetime64(time, 's'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Catalog UF files in SQLite from their headers.')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    build = subparsers.add_parser('build', help='add files to a catalog')
+    build.add_argument('database', help='SQLite catalog')
+    build.add_argument('paths', nargs='+', help='UF files and directories')
+    build.add_argument('--pattern', default='*',
+                       help='pattern of file names in directories')
+
+    query = subparsers.add_parser('query', help='find volumes in a catalog')
+    query.add_argument('database', help='SQLite catalog')
+    query.add_argument('--radar-name')
+    query.add_argument('--site-name')
+    query.add_argument('--start', help='start of the period, ISO 8601')
+    query.add_argument('--end', help='end of the period, ISO 8601')
+    query.add_argument('--fixed-angle', type=float,
+                       help='fixed angle of a sweep in degrees')
+    query.add_argument('--scan-type', help='scan type of a sweep, ppi, rhi')
+    query.add_argument('--data-type', help='UF data type of a field')
+    query.add_argument('--angle-tolerance', type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        ncataloged = build_catalog(args.database, args.paths, args.pattern)
+        print('cataloged %d files' % (ncataloged))
+    else:
+        paths = query_catalog(
+            args.database, radar_name=args.radar_name,
+            site_name=args.site_name, start=args.start, end=args.end,
+            fixed_angle=args.fixed_angle, scan_type=args.scan_type,
+            data_type=args.data_type, angle_tolerance=args.angle_tolerance)
+        for path in paths:
+            print(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,8 +6,20 @@
 """
 
 
+import io
+import os
+import bz2
+import gzip
+import mmap
+import zlib
 import struct
+import operator
+import zipfile
 import datetime
+import warnings
+import threading
+from timeit import default_timer
+from collections.abc import MutableMapping
 
 import numpy as np
 
@@ -20,154 +32,619 @@ class UFFile(object):
     ----------
     filename : str or file-like
         Filename or file-like object containing data in Universal format (UF).
+        Gzip and bzip2 compressed data is detected and decompressed.
+    use_mmap : bool, optional
+        True to memory map the file when a filename is provided, in which
+        case the rays reference the mapped file rather than holding a copy
+        of the record.  False will read the file into memory.  Ignored when
+        a file-like object is provided or the file is compressed.
+    sweeps : int or sequence of int, optional
+        Indices of the sweeps to read, rays in other sweeps are skipped
+        without being decoded.  None, the default, reads all sweeps.
+    fixed_angle_range : (float, float), optional
+        Minimum and maximum fixed angle in degrees of the sweeps to read.
+        None, the default, does not select sweeps by fixed angle.
+    field_filter : callable, optional
+        Function called with the data type of each field in the file, as a
+        str such as 'DZ', data from fields for which a false value is
+        returned is never read.
+        None, the default, will read all fields.
+    index_file : str or bool, optional
+        Path to an index file storing the record offsets, padding, header
+        tables and sweep limits of the file.  If the index file is valid for
+        the file, as determined by the file size and modification time, it
+        is used in place of scanning the file, otherwise the file is scanned
+        and the index file is written.  True will use the filename with a
+        '.idx' extension appended.  None, the default, does not use an
+        index file.  Requires a filename.  For compressed files only the
+        data up to the end of the last selected record is decompressed when
+        the index file is valid.
+    stats : ReadStats, optional
+        Object in which the time spent and the amount of data processed in
+        each stage of reading the file is recorded.  None, the default,
+        does not record statistics.
+    recover : bool, optional
+        True to skip corrupted or truncated records rather than failing or
+        misreading them.  Each record is checked for the 'UF' string, a
+        record_length which lies within the file, padding which matches the
+        record size and headers which lie within the record.  After a bad
+        record the next valid record is found by searching for the 'UF'
+        string.  The skipped byte ranges are reported in skipped_ranges.
+        Files without padding have less redundancy, a record followed by
+        invalid data is also skipped.  False, the default, trusts the
+        record_length of every record.
 
     Attributes
     ----------
-    rays : list of UFRay objects
-        List of rays within the UF file.
+    rays : list-like of UFRay objects
+        Rays within the UF file, each ray is created when first accessed.
     nrays, nsweeps : int
         Number of rays and sweep in the file.
     ray_sweep_numbers : array
         Sweep number of each ray in the file.
     first_ray_in_sweep, last_ray_in_sweep : array
         Indices of the first and last ray in each sweep.
+    padding : int
+        Size of the padding in bytes before and after each record, 0, 2 or 4.
+    record_offsets : array
+        Offset in bytes to the start of each record (ray) in the file.
+    mandatory_headers, data_headers : record array
+        Mandatory and data header of each ray in the file.
+    field_positions, field_headers : record array
+        Field position information and field headers of each ray in the
+        file, dimensioned (nrays, nfields).  The field headers include the
+        nyquist velocity for velocity fields.
+    field_has_nyquist : array
+        True when the corresponding field header contains a nyquist
+        velocity.
+    field_is_read : array
+        True for fields whose data is read, as selected by field_filter.
+    compression : str or None
+        Compression of the file, 'gzip', 'bz2' or None for uncompressed
+        files.
+    skipped_ranges : list of (int, int)
+        Start and end offsets in bytes of the data which is not part of a
+        valid record, only determined when recover is True.
+
+    Notes
+    -----
+    Files which are still being written can be followed by calling the
+    update method, which reads the records appended to the file since it was
+    opened.  Such a file can only be opened once its first record is
+    complete, an IOError is raised before then.  When a fixed_angle_range
+    is given a ValueError is raised until a complete record in a selected
+    sweep has been written.
+
+    Compressed files are decompressed in chunks into a single buffer, the
+    compressed data is never held in memory in its entirety.
 
     """
 
-    def __init__(self, filename):
+    def __init__(self, filename, use_mmap=True, sweeps=None,
+                 fixed_angle_range=None, field_filter=None, index_file=None,
+                 stats=None, recover=False):
         """ initialize. """
-
-        # open the file if file object not passed
+        self.stats = stats
+        self._recover = recover
+
+        # load the record offsets, padding and header tables from the index
+        # file when it is valid for the file, skipping the scan of the file.
+        index = None
+        if index_file is not None:
+            if hasattr(filename, 'read'):
+                raise ValueError('index_file requires a filename')
+            if index_file is True:
+                index_file = filename + '.idx'
+            with _Stage(stats, 'index read') as stage:
+                index = _read_index(index_file, filename)
+                if index is not None:
+                    stage.nobjects = len(index['record_offsets'])
+
+        # memory map the file when a filename is passed so that each ray
+        # references the page cache rather than a copy of the record,
+        # file objects are read into memory in a single call.  Compressed
+        # data is read and decompressed in chunks.
         if hasattr(filename, 'read'):
-            fobj = filename
-            close_fobj = False
+            magic = filename.read(3)
+            compression = _get_compression(magic)
+            if compression is not None:
+                with _Stage(stats, 'decompression') as stage:
+                    buf = _decompress(filename, compression, head=magic)
+                    stage.nbytes = len(buf)
+            elif hasattr(filename, 'seekable') and filename.seekable():
+                filename.seek(-len(magic), io.SEEK_CUR)
+                buf = filename.read()
+            else:
+                buf = magic + filename.read()
+        else:
+            with open(filename, 'rb') as fobj:
+                # the size and modification time of the file which is read
+                # are stored in the index, not those when it is written.
+                file_stat = os.fstat(fobj.fileno())
+                compression = _get_compression(fobj.read(3))
+                fobj.seek(0)
+                if compression is not None:
+                    stop = None
+                    if index is not None:
+                        stop = _selected_records_end(
+                            index, sweeps, fixed_angle_range)
+                    with _Stage(stats, 'decompression') as stage:
+                        buf = _decompress(fobj, compression, stop)
+                        stage.nbytes = len(buf)
+                elif use_mmap and file_stat.st_size != 0:
+                    buf = mmap.mmap(fobj.fileno(), 0, access=mmap.ACCESS_READ)
+                else:
+                    buf = fobj.read()
+        self._buf = buf
+        self._filename = None
+        if not hasattr(filename, 'read'):
+            self._filename = filename
+        self._use_mmap = use_mmap
+        self._sweeps = sweeps
+        self._fixed_angle_range = fixed_angle_range
+        self.compression = compression
+
+        selected = None
+        if index is not None:
+            last_offset = index['record_offsets'][-1]
+            last_size = _byte_size(
+                index['mandatory_headers']['record_length'][-1])
+            scan_end = int(last_offset + last_size + index['padding'])
         else:
-            fobj = open(filename, 'rb')
-            close_fobj = True
-
-        # UF files come in three 'flavors' depending upon the size of the
-        # padding around each record.  True UF files contain no padding
-        # and start with the mandatory header of the first ray.  Other UF
-        # files contain a 2 or 4-byte padding immediately before and after
-        # each record.  The values in this padding can used to determine the
-        # size of each record, but is not used here, rather the size indicated
-        # by the 'record_length' structure elements is used.
-
-        # determine padding around records
-        buf = fobj.read(8)
-        try:
-            padding = buf.index(b'UF')
-        except ValueError:
-            raise IOError('file in not a valid UF file')
 
-        # read in the records, store as a list of rays
-        self.rays = []
-        while len(buf) == 8:  # read until EOF reached
+            # UF files come in three 'flavors' depending upon the size of the
+            # padding around each record.  True UF files contain no padding
+            # and start with the mandatory header of the first ray.  Other UF
+            # files contain a 2 or 4-byte padding immediately before and
+            # after each record.  The values in this padding can used to
+            # determine the size of each record, but is not used here, rather
+            # the size indicated by the 'record_length' structure elements is
+            # used.
+
+            # determine padding around records
+            if len(buf) < 8:
+                raise IOError('file contains no complete records')
+            if recover:
+                padding = _recover_padding(buf)
+            else:
+                padding = _find_padding(buf)
+
+            # find the offset of each record, the rays are only created from
+            # the records when first accessed.
+            with _Stage(stats, 'record scan') as stage:
+                if recover:
+                    record_offsets, scan_end, skipped_ranges = (
+                        _recover_records(buf, padding))
+                else:
+                    record_offsets, scan_end = _scan_records(buf, padding)
+                    skipped_ranges = []
+                record_offsets = np.array(record_offsets, dtype='int64')
+                stage.nbytes = scan_end
+                stage.nobjects = len(record_offsets)
+
+            with _Stage(stats, 'header decode') as stage:
+                mandatory_headers = _unpack_table(
+                    buf, record_offsets, UF_MANDATORY_HEADER_DTYPE)
+                if recover:
+                    record_offsets, mandatory_headers, skipped_ranges = (
+                        _drop_invalid_records(
+                            buf, padding, record_offsets, mandatory_headers,
+                            skipped_ranges))
+                if len(record_offsets) == 0:
+                    raise IOError('file contains no complete records')
+
+                # skip the records which are not in the selected sweeps,
+                # unless an index of all records is to be written.
+                if index_file is None:
+                    selected = _select_sweeps(
+                        mandatory_headers, sweeps, fixed_angle_range)
+                    record_offsets = record_offsets[selected]
+                    mandatory_headers = mandatory_headers[selected]
+
+                # decode the remaining headers of all rays into record arrays
+                index = _decode_headers(
+                    buf, record_offsets, mandatory_headers)
+                index['padding'] = padding
+                index['skipped_ranges'] = np.array(
+                    skipped_ranges, dtype='int64').reshape(-1, 2)
+                stage.nobjects = len(record_offsets)
+            if index_file is not None:
+                _write_index(index_file, file_stat, index)
+
+        if selected is None:
+            selected = _select_sweeps(
+                index['mandatory_headers'], sweeps, fixed_angle_range)
+            if not selected.all():
+                for name in _HEADER_TABLES:
+                    index[name] = index[name][selected]
+                del index['first_ray_in_sweep'], index['last_ray_in_sweep']
+        if len(index['record_offsets']) == 0:
+            raise ValueError('no rays in the selected sweeps')
+
+        self._scan_end = scan_end
+        self.padding = int(index['padding'])
+        self.skipped_ranges = [
+            (int(start), int(end)) for start, end in index['skipped_ranges']]
+        for name in _HEADER_TABLES:
+            setattr(self, name, index[name])
 
-            # record size stored as a 2-byte int start at byte 2
-            record_size = struct.unpack('>h', buf[padding+2:padding+4])[0] * 2
+        # determine volume size statistics
+        self.nrays = len(self.record_offsets)
 
-            # read in full record
-            bytes_read = len(buf) - padding
-            bytes_to_read = record_size - bytes_read
-            record = buf[-bytes_read:] + fobj.read(bytes_to_read)
+        self.field_is_read = np.array(
+            [field_filter is None or
+             bool(field_filter(_data_type_str(data_type)))
+             for data_type in self.field_positions['data_type'][0]],
+            dtype='bool')
+        self.rays = _LazyRayList(
+            buf, self.record_offsets, self._get_header_tables(), field_filter)
 
-            # convert record into UFRay
-            self.rays.append(UFRay(record))
+        # determine sweep information
+        self.ray_sweep_numbers = self._get_ray_sweep_numbers()
+        self.nsweeps = len(np.unique(self.ray_sweep_numbers))
+        if 'first_ray_in_sweep' in index:
+            first_ray_in_sweep = index['first_ray_in_sweep']
+            last_ray_in_sweep = index['last_ray_in_sweep']
+        else:
+            first_ray_in_sweep, last_ray_in_sweep = self._get_sweep_limits()
+        self.first_ray_in_sweep = first_ray_in_sweep
+        self.last_ray_in_sweep = last_ray_in_sweep
 
-            # read post record padding
-            fobj.read(padding)
+    def update(self):
+        """
+        Read the records appended to the file since it was opened or updated.
 
-            # read in the first eight bytes of the next record
-            buf = fobj.read(8)
+        The rays, header tables and sweep information are extended with the
+        complete records written to the end of the file, the records before
+        these are not read again.  A partially written record at the end of
+        the file is read by a later call once it is complete.  A sweep is
+        complete once rays from a following sweep have been read.
 
-        # determine volume size statistics
-        self.nrays = len(self.rays)
+        Returns
+        -------
+        nrays : int
+            Number of rays added.
 
-        # determine sweep information
+        """
+        if self._filename is None:
+            raise ValueError('update requires a filename')
+        if self._sweeps is not None:
+            raise ValueError('update cannot be used when sweeps are selected')
+        if self.compression is not None:
+            raise ValueError('update cannot be used with compressed files')
+
+        with open(self._filename, 'rb') as fobj:
+            if os.fstat(fobj.fileno()).st_size <= self._scan_end:
+                return 0
+            if self._use_mmap:
+                buf = mmap.mmap(fobj.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                fobj.seek(len(self._buf))
+                buf = self._buf + fobj.read()
+
+        # scan and decode only the records after the last complete record,
+        # data skipped at the end of the file is scanned again.
+        with _Stage(self.stats, 'record scan') as stage:
+            if self._recover:
+                record_offsets, scan_end, skipped_ranges = _recover_records(
+                    buf, self.padding, self._scan_end)
+            else:
+                record_offsets, scan_end = _scan_records(
+                    buf, self.padding, self._scan_end)
+                skipped_ranges = []
+            record_offsets = np.array(record_offsets, dtype='int64')
+            stage.nbytes = scan_end - self._scan_end
+            stage.nobjects = len(record_offsets)
+        with _Stage(self.stats, 'header decode') as stage:
+            mandatory_headers = _unpack_table(
+                buf, record_offsets, UF_MANDATORY_HEADER_DTYPE)
+            if self._recover:
+                record_offsets, mandatory_headers, skipped_ranges = (
+                    _drop_invalid_records(
+                        buf, self.padding, record_offsets, mandatory_headers,
+                        skipped_ranges))
+            selected = _select_sweeps(
+                mandatory_headers, None, self._fixed_angle_range)
+            index = _decode_headers(
+                buf, record_offsets[selected], mandatory_headers[selected])
+            stage.nobjects = len(index['record_offsets'])
+        data_types = index['field_positions']['data_type']
+        if len(data_types) and not np.array_equal(
+                data_types[0], self.field_positions['data_type'][0]):
+            raise IOError('appended rays have a different field layout')
+        self.skipped_ranges = [
+            skipped for skipped in self.skipped_ranges
+            if skipped[0] < self._scan_end] + skipped_ranges
+        self._buf = buf
+        self._scan_end = scan_end
+        nrays = len(index['record_offsets'])
+        if nrays == 0:
+            return 0
+
+        # extend the header tables, rays and sweep information
+        for name in _HEADER_TABLES:
+            table = np.concatenate([getattr(self, name), index[name]])
+            setattr(self, name, table)
+        self.rays._extend(
+            buf, self.record_offsets, self._get_header_tables())
+        first_ray_in_sweep, last_ray_in_sweep = _merge_sweep_limits(
+            self.ray_sweep_numbers, self.first_ray_in_sweep,
+            self.last_ray_in_sweep, index['mandatory_headers']['sweep_number'],
+            index['first_ray_in_sweep'] + self.nrays,
+            index['last_ray_in_sweep'] + self.nrays)
+        self.nrays = len(self.record_offsets)
         self.ray_sweep_numbers = self._get_ray_sweep_numbers()
-        self.nsweeps = len(np.unique(self.ray_sweep_numbers))
-        first_ray_in_sweep, last_ray_in_sweep = self._get_sweep_limits()
+        self.nsweeps = len(first_ray_in_sweep)
         self.first_ray_in_sweep = first_ray_in_sweep
         self.last_ray_in_sweep = last_ray_in_sweep
-
-        if close_fobj:
-            fobj.close()
+        return nrays
 
     def _get_ray_sweep_numbers(self):
         """ Return an array of the sweep_number stored in each ray. """
-        ray_sweep_numbers = np.empty((self.nrays, ), dtype='int32')
-        for i, ray in enumerate(self.rays):
-            ray_sweep_numbers[i] = ray.mandatory_header['sweep_number']
-        return ray_sweep_numbers
+        return self.mandatory_headers['sweep_number'].astype('int32')
 
     def _get_sweep_limits(self):
         """ Return arrays of indices of first and last ray in each sweep. """
-        first_ray_in_sweep = np.empty(self.nsweeps, dtype='int32')
-        last_ray_in_sweep = np.empty(self.nsweeps, dtype='int32')
-        unique_sweep_numbers = np.unique(self.ray_sweep_numbers)
-        for i, sweep_number in enumerate(unique_sweep_numbers):
-            matches = np.where(self.ray_sweep_numbers == sweep_number)
-            first_ray_in_sweep[i] = matches[0][0]
-            last_ray_in_sweep[i] = matches[0][-1]
-        return first_ray_in_sweep, last_ray_in_sweep
+        return _sweep_limits(self.ray_sweep_numbers)
 
-    def get_field_data(self, field_number):
-        """ Return a 2D array of scale/masked field data for the volume. """
+    def get_field_data(self, field_number, range_window=None, ray_step=1,
+                       gate_step=1):
+        """
+        Return a 2D array of scale/masked field data for the volume.
+
+        Parameters
+        ----------
+        field_number : int
+            Index of the field in the file.
+        range_window : (float, float), optional
+            Minimum and maximum range, in meters, of the gates to return, see
+            get_gate_slice.  Gates outside the window are not decoded.  None,
+            the default, returns all gates.
+        ray_step, gate_step : int, optional
+            Return only every ray_step-th ray of each sweep, see
+            get_strided_rays, and every gate_step-th gate in the window.
+
+        """
         # Assumes that no rays contain more gates than the first ray and
         # that the missing_data_value and scale_factor are identical for all
         # rays.  Additional the order and number of the fields are assumed to
-        # be identical between rays.
-        first_ray = self.rays[0]
-        ngates = len(first_ray.field_raw_data[field_number])
-        missing_data_value = first_ray.mandatory_header['missing_data_value']
-        scale_factor = first_ray.field_headers[field_number]['scale_factor']
-
-        raw_data = np.empty((self.nrays, ngates), 'int16')
-        for i, ray in enumerate(self.rays):
-            ray_data = ray.field_raw_data[field_number]
-            bins = len(ray_data)
-            raw_data[i, :bins] = ray.field_raw_data[field_number]
-            raw_data[i, bins:] = missing_data_value
-
-        data = raw_data / float(scale_factor)
-        mask = raw_data == missing_data_value
+        # be identical between rays.  Use get_ragged_field_data or
+        # get_sweep_field_data for volumes where the number of gates varies.
+        ngates = self.field_headers['nbins'][0, field_number]
+        rays = np.arange(self.nrays)
+        if _check_step(ray_step, 'ray_step') != 1:
+            rays = self.get_strided_rays(ray_step)[0]
+        gates = self.get_gate_slice(field_number, range_window, gate_step)
+        return self._get_dense_field_data(field_number, rays, ngates, gates)
+
+    def get_strided_rays(self, ray_step):
+        """
+        Return the indices of every ray_step-th ray in each sweep.
+
+        The first ray of each sweep is always included.  Returns an array of
+        the ray indices and arrays of the positions of the first and last of
+        these rays in each sweep.
+        """
+        ray_step = _check_step(ray_step, 'ray_step')
+        keep = np.zeros((self.nrays, ), dtype='bool')
+        for first, last in zip(self.first_ray_in_sweep,
+                               self.last_ray_in_sweep):
+            keep[first:last + 1:ray_step] = True
+        rays = np.nonzero(keep)[0]
+        first_ray_in_sweep = np.searchsorted(rays, self.first_ray_in_sweep)
+        last_ray_in_sweep = np.searchsorted(
+            rays, self.last_ray_in_sweep, side='right') - 1
+        return rays, first_ray_in_sweep, last_ray_in_sweep
+
+    def get_gate_slice(self, field_number=0, range_window=None, gate_step=1):
+        """
+        Return a slice selecting the gates of a field in a range window.
+
+        The range of each gate is determined from the range_start and
+        range_spacing of the field in the first ray.  Gates whose range lies
+        within the inclusive (min, max) range_window, in meters, are selected
+        with a step of gate_step.  None selects all gates.
+        """
+        gate_step = _check_step(gate_step, 'gate_step')
+        field_header = self.field_headers[0, field_number]
+        ngates = int(field_header['nbins'])
+        first_gate, last_gate = 0, ngates
+        if range_window is not None:
+            start = (int(field_header['range_start_km']) * 1000 +
+                     int(field_header['range_start_m']))
+            step = float(field_header['range_spacing_m'])
+            min_range, max_range = range_window
+            first_gate = max(int(np.ceil((min_range - start) / step)), 0)
+            last_gate = min(int(np.floor((max_range - start) / step)) + 1,
+                            ngates)
+            if last_gate <= first_gate:
+                raise ValueError('no gates in the range_window')
+        return slice(first_gate, last_gate, gate_step)
+
+    def get_sweep_field_data(self, field_number, sweep):
+        """
+        Return a 2D array of scale/masked field data for a single sweep.
+
+        The number of gates is the largest number of gates of any ray in the
+        sweep, shorter rays are padded with masked values.
+        """
+        rays, ngates = self._get_sweep_rays(field_number, sweep)
+        return self._get_dense_field_data(field_number, rays, ngates)
+
+    def get_sweep_raw_field_data(self, field_number, sweep):
+        """
+        Return a 2D array of raw (unscaled) int16 field data for a sweep.
+
+        The gates are padded with the missing_data_value as in
+        get_sweep_field_data.
+        """
+        rays, ngates = self._get_sweep_rays(field_number, sweep)
+        return self._get_dense_raw_data(field_number, rays, ngates)
+
+    def _get_sweep_rays(self, field_number, sweep):
+        """ Return the rays in a sweep and the largest number of gates. """
+        first = self.first_ray_in_sweep[sweep]
+        last = self.last_ray_in_sweep[sweep]
+        rays = np.arange(first, last + 1)
+        ngates = self.field_headers['nbins'][rays, field_number].max()
+        return rays, ngates
+
+    def get_ragged_field_data(self, field_number):
+        """
+        Return the raw field data for the volume without padding.
+
+        Parameters
+        ----------
+        field_number : int
+            Index of the field in the file.
+
+        Returns
+        -------
+        raw_data : array
+            Raw (unscaled) int16 field data for all gates of every ray,
+            stored ray after ray.
+        ray_offsets : array
+            Index of the first gate of each ray in raw_data.
+        ray_nbins : array
+            Number of gates in each ray.
+
+        """
+        self._check_field_is_read(field_number)
+        data_offsets = self._get_data_offsets(field_number)
+        ray_nbins = self.field_headers['nbins'][:, field_number]
+        ray_nbins = ray_nbins.astype('int64')
+        ray_offsets = np.zeros((self.nrays, ), dtype='int64')
+        np.cumsum(ray_nbins[:-1], out=ray_offsets[1:])
+
+        with _Stage(self.stats, 'field decode') as stage:
+            raw_data = np.empty((ray_nbins.sum(), ), dtype='int16')
+            for offset, start, bins in zip(
+                    data_offsets, ray_offsets, ray_nbins):
+                raw_data[start:start + bins] = np.frombuffer(
+                    self._buf, dtype='>i2', count=bins, offset=offset)
+            stage.nbytes = raw_data.nbytes
+            stage.nobjects = self.nrays
+        return raw_data, ray_offsets, ray_nbins
+
+    def get_sweep_ranges(self, field_number=0):
+        """
+        Return a list of arrays of gate ranges in meters for each sweep.
+
+        The gate spacing and start of the first ray in each sweep are used,
+        the number of gates matches that from get_sweep_field_data.
+        """
+        field_headers = self.field_headers[:, field_number]
+        ranges = []
+        for first, last in zip(self.first_ray_in_sweep,
+                               self.last_ray_in_sweep):
+            ngates = field_headers['nbins'][first:last + 1].max()
+            start = (int(field_headers['range_start_km'][first]) * 1000 +
+                     int(field_headers['range_start_m'][first]))
+            step = field_headers['range_spacing_m'][first]
+            ranges.append(np.arange(ngates, dtype='float32') * step + start)
+        return ranges
+
+    def _check_field_is_read(self, field_number):
+        """ Raise a ValueError if a field was excluded by field_filter. """
+        if not self.field_is_read[field_number]:
+            raise ValueError(
+                'field %d was excluded by field_filter' % (field_number))
+
+    def _get_data_offsets(self, field_number):
+        """ Return the offset in bytes to the data of a field in each ray. """
+        data_offset = self.field_headers['data_offset'][:, field_number]
+        return self.record_offsets + _byte_offset(data_offset)
+
+    def _get_dense_field_data(self, field_number, rays, ngates,
+                              gates=slice(None)):
+        """
+        Return a 2D array of scale/masked field data for a number of rays.
+
+        Rays with fewer gates than ngates are padded, those with more gates
+        are truncated.  Only the gates selected by the gates slice of these
+        are returned.
+        """
+        missing_data_value = self.mandatory_headers['missing_data_value'][0]
+        scale_factor = self.field_headers['scale_factor'][0, field_number]
+        raw_data = self._get_dense_raw_data(field_number, rays, ngates, gates)
+
+        # scale and mask as whole array operations which release the GIL
+        with _Stage(self.stats, 'field scaling') as stage:
+            data = np.divide(raw_data, float(scale_factor), dtype='float64')
+            mask = np.equal(raw_data, missing_data_value)
+            stage.nbytes = data.nbytes
+            stage.nobjects = len(rays)
         return np.ma.masked_array(data, mask)
 
+    def _get_dense_raw_data(self, field_number, rays, ngates,
+                            gates=slice(None)):
+        """
+        Return a 2D array of raw field data for a number of rays.
+
+        Rays with fewer gates than ngates are padded with the
+        missing_data_value, those with more gates are truncated.  Only the
+        gates selected by the gates slice of these are returned.
+        """
+        self._check_field_is_read(field_number)
+        missing_data_value = self.mandatory_headers['missing_data_value'][0]
+        start, stop, step = gates.indices(ngates)
+
+        # read the raw data of the selected gates directly from the records
+        with _Stage(self.stats, 'field decode') as stage:
+            data_offsets = self._get_data_offsets(field_number)[rays]
+            data_offsets += start * 2
+            nbins = np.clip(
+                self.field_headers['nbins'][rays, field_number],
+                start, stop) - start
+            raw_data = np.empty(
+                (len(rays), len(range(start, stop, step))), 'int16')
+            uniform = (len(rays) != 0 and nbins[0] != 0 and
+                       np.all(nbins == nbins[0]) and
+                       not np.any(data_offsets % 2))
+            if uniform:
+                # every ray has the same number of selected gates, gather the
+                # data of all rays in a single operation as is done for the
+                # headers in _unpack_table.
+                words = np.frombuffer(
+                    self._buf, dtype='>i2', count=len(self._buf) // 2)
+                index = (data_offsets[:, np.newaxis] // 2 +
+                         np.arange(0, nbins[0], step))
+                raw_data[:, :index.shape[1]] = words[index]
+                raw_data[:, index.shape[1]:] = missing_data_value
+            else:
+                # ragged rays are read one at a time
+                for i, (offset, bins) in enumerate(zip(data_offsets, nbins)):
+                    if bins == 0:   # ray ends before the first selected gate
+                        raw_data[i] = missing_data_value
+                        continue
+                    ray_data = np.frombuffer(
+                        self._buf, dtype='>i2', count=bins, offset=offset)
+                    ray_data = ray_data[::step]
+                    raw_data[i, :len(ray_data)] = ray_data
+                    raw_data[i, len(ray_data):] = missing_data_value
+            stage.nbytes = raw_data.nbytes
+            stage.nobjects = len(rays)
+        return raw_data
+
     def get_azimuths(self):
         """ Return an array of azimuth angles for each ray in degrees. """
-        azimuth = np.empty((self.nrays, ), dtype='float32')
-        for i, ray in enumerate(self.rays):
-            azimuth[i] = ray.mandatory_header['azimuth'] / 64.
-        return azimuth
+        return (self.mandatory_headers['azimuth'] / 64.).astype('float32')
 
     def get_elevations(self):
         """ Return an array of elevation angles for each ray in degrees. """
-        elevation = np.empty((self.nrays, ), dtype='float32')
-        for i, ray in enumerate(self.rays):
-            elevation[i] = ray.mandatory_header['elevation'] / 64.
-        return elevation
+        return (self.mandatory_headers['elevation'] / 64.).astype('float32')
 
     def get_sweep_rates(self):
         """ Return an array of sweep rates for each ray in degrees/sec. """
-        sweep_rates = np.empty((self.nrays, ), dtype='float32')
-        for i, ray in enumerate(self.rays):
-            sweep_rates[i] = ray.mandatory_header['sweep_rate'] / 64.
-        return sweep_rates
+        return (self.mandatory_headers['sweep_rate'] / 64.).astype('float32')
 
     def get_pulse_widths(self):
         """ Return an array of pulse widths for each ray in meters. """
-        pulse_widths = np.empty((self.nrays, ), dtype='float32')
-        for i, ray in enumerate(self.rays):
-            pulse_widths[i] = ray.field_headers[0]['pulse_width_m']
-        return pulse_widths
+        return self.field_headers['pulse_width_m'][:, 0].astype('float32')
 
     def get_prts(self):
         """ Return an array of prts for each ray in microseconds. """
-        prts = np.empty((self.nrays, ), dtype='float32')
-        for i, ray in enumerate(self.rays):
-            prts[i] = ray.field_headers[0]['prt_ms']
-        return prts
+        return self.field_headers['prt_ms'][:, 0].astype('float32')
 
     def get_nyquists(self):
         """
@@ -175,41 +652,272 @@ class UFFile(object):
 
         Returns None if nyquist velocities cannot be determined for all rays.
         """
-        field_headers = self.rays[0].field_headers
-        try:
-            field_idx = ['nyquist' in fh for fh in field_headers].index(True)
-        except ValueError:
-            return None  # True not in list
-        nyquist = np.empty((self.nrays, ), dtype='float32')
-        for i, ray in enumerate(self.rays):
-            scale = ray.field_headers[field_idx]['scale_factor']
-            try:
-                nyquist[i] = ray.field_headers[field_idx]['nyquist'] / scale
-            except KeyError:
-                return None  # nyquist not in field header
-        return nyquist
+        if not self.field_has_nyquist[0].any():
+            return None
+        field_idx = np.argmax(self.field_has_nyquist[0])
+        if not self.field_has_nyquist[:, field_idx].all():
+            return None     # nyquist not in field header
+        field_headers = self.field_headers[:, field_idx]
+        nyquist = field_headers['nyquist'] / field_headers['scale_factor']
+        return nyquist.astype('float32')
 
     def get_sweep_fixed_angles(self):
         """ Return an array of fixed angles for each sweep in degrees. """
-        fixed = np.empty((self.nsweeps, ), dtype='float32')
-        for i, ray_num in enumerate(self.first_ray_in_sweep):
-            fixed[i] = self.rays[ray_num].mandatory_header['fixed_angle'] / 64.
-        return fixed
+        fixed = self.mandatory_headers['fixed_angle'][self.first_ray_in_sweep]
+        return (fixed / 64.).astype('float32')
 
     def get_sweep_polarizations(self):
         """ Return an array of polarization modes for each sweep. """
-        modes = []
-        for ray_num in self.first_ray_in_sweep:
-            ray = self.rays[ray_num]
-            polarization = ray.field_headers[0]['polarization']
-            if polarization > 3:
-                polarization = 3
-            modes.append(POLARIZATION_STR[polarization])
-        return np.array(modes)
+        field_headers = self.field_headers[self.first_ray_in_sweep, 0]
+        polarizations = np.minimum(field_headers['polarization'], 3)
+        return np.array(POLARIZATION_STR)[polarizations]
 
     def get_datetimes(self):
         """ Return a list of datetimes for each ray. """
-        return [ray.get_datetime() for ray in self.rays]
+        return self.get_times().astype(datetime.datetime).tolist()
+
+    def get_times(self):
+        """ Return an array of datetime64 times for each ray. """
+        return _header_datetime64(self.mandatory_headers)
+
+    def iter_rays(self):
+        """
+        Iterate over the rays in the file.
+
+        Each ray is created from its record as it is reached and is not
+        stored in the rays attribute.
+        """
+        for i in range(self.nrays):
+            yield self.rays._create_ray(i)
+
+    def _get_header_tables(self):
+        """ Return the header tables from which rays are created. """
+        return (self.mandatory_headers, self.data_headers,
+                self.field_positions, self.field_headers,
+                self.field_has_nyquist)
+
+
+class UFVolume(object):
+    """
+    A volume of radar data from a UF file held in NumPy arrays.
+
+    A lightweight alternative to a Py-ART Radar object which does not
+    require Py-ART to be installed or imported, see read_uf_arrays.
+
+    Parameters
+    ----------
+    ufile : UFFile
+        UF file from which the volume is created.  The data of every field
+        which is read, as selected by the field_filter of the file, is
+        loaded.
+
+    Attributes
+    ----------
+    time : array
+        Time of each ray, datetime64[s].
+    azimuth, elevation : array
+        Azimuth and elevation angle of each ray in degrees.
+    range : array
+        Distance in meters to the start of each gate, the number of gates,
+        their spacing and the distance to the first gate are taken from
+        the first ray.
+    fields : dict
+        Scaled and masked field data dimensioned (nrays, ngates), keyed by
+        UF data type.
+    sweep_start_ray_index, sweep_end_ray_index : array
+        Indices of the first and last ray in each sweep.
+    fixed_angle : array
+        Fixed angle of each sweep in degrees.
+    latitude, longitude, altitude : float
+        Location of the radar in degrees and meters.
+    radar_name, site_name : str
+        Radar and site name from the mandatory header of the first ray.
+    nrays, ngates, nsweeps : int
+        Number of rays, gates and sweeps in the volume.
+
+    """
+
+    def __init__(self, ufile):
+        """ initialize. """
+        first_ray = ufile.rays[0]
+        self.time = ufile.get_times()
+        self.azimuth = ufile.get_azimuths()
+        self.elevation = ufile.get_elevations()
+
+        field_header = first_ray.field_headers[0]
+        start = (int(field_header['range_start_km']) * 1000 +
+                 int(field_header['range_start_m']))
+        step = field_header['range_spacing_m']
+        ngates = field_header['nbins']
+        self.range = np.arange(ngates, dtype='float32') * step + start
+
+        self.fields = {}
+        for field_number, data_type in enumerate(
+                ufile.field_positions['data_type'][0]):
+            if ufile.field_is_read[field_number]:
+                self.fields[_data_type_str(data_type)] = (
+                    ufile.get_field_data(field_number))
+
+        self.sweep_start_ray_index = ufile.first_ray_in_sweep
+        self.sweep_end_ray_index = ufile.last_ray_in_sweep
+        self.fixed_angle = ufile.get_sweep_fixed_angles()
+        self.latitude, self.longitude, self.altitude = (
+            first_ray.get_location())
+        self.radar_name = _data_type_str(
+            first_ray.mandatory_header['radar_name'])
+        self.site_name = _data_type_str(
+            first_ray.mandatory_header['site_name'])
+
+        self.nrays = ufile.nrays
+        self.ngates = int(ngates)
+        self.nsweeps = ufile.nsweeps
+
+
+class ReadStats(object):
+    """
+    Timing and counters of the stages of reading UF files.
+
+    An instance can be passed as the stats parameter of UFFile or read_uf,
+    the wall time, number of calls, bytes and objects (rays or records)
+    processed by each stage are accumulated.  The stages are 'index read',
+    'decompression', 'record scan', 'header decode', 'field decode',
+    'field scaling', 'time conversion' and 'radar construction', only the
+    stages which are performed are recorded.  Stages may be recorded from
+    multiple threads.
+
+    Parameters
+    ----------
+    callback : callable, optional
+        Function called with the stage name, wall time in seconds, bytes
+        and objects each time a stage completes.  None, the default, does
+        not call a function.
+
+    Attributes
+    ----------
+    stages : dict
+        Dictionary keyed by stage name of dictionaries with 'time', 'calls',
+        'bytes' and 'objects' keys holding the totals of each stage.
+
+    """
+
+    def __init__(self, callback=None):
+        """ initialize. """
+        self.callback = callback
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, elapsed, nbytes=0, nobjects=0):
+        """ Record a completed stage. """
+        with self._lock:
+            totals = self.stages.setdefault(
+                stage, {'time': 0., 'calls': 0, 'bytes': 0, 'objects': 0})
+            totals['time'] += elapsed
+            totals['calls'] += 1
+            totals['bytes'] += int(nbytes)
+            totals['objects'] += int(nobjects)
+        if self.callback is not None:
+            self.callback(stage, elapsed, nbytes, nobjects)
+
+    def summary(self):
+        """ Return a table of the totals of each stage as a string. """
+        lines = ['%-20s %10s %6s %12s %9s' % (
+            'stage', 'time (s)', 'calls', 'bytes', 'objects')]
+        for stage in sorted(self.stages, key=_STAT_STAGES.index):
+            totals = self.stages[stage]
+            lines.append('%-20s %10.4f %6d %12d %9d' % (
+                stage, totals['time'], totals['calls'], totals['bytes'],
+                totals['objects']))
+        return '\n'.join(lines)
+
+
+class _Stage(object):
+    """
+    Context manager which records the wall time of a stage in a ReadStats.
+
+    The nbytes and nobjects attributes may be set within the context.  No
+    timing is performed when stats is None.
+    """
+
+    __slots__ = ('stats', 'name', 'nbytes', 'nobjects', '_start')
+
+    def __init__(self, stats, name):
+        """ initialize. """
+        self.stats = stats
+        self.name = name
+        self.nbytes = 0
+        self.nobjects = 0
+
+    def __enter__(self):
+        if self.stats is not None:
+            self._start = default_timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.stats is not None and exc_type is None:
+            elapsed = default_timer() - self._start
+            self.stats.record(self.name, elapsed, self.nbytes, self.nobjects)
+        return False
+
+
+class _LazyRayList(object):
+    """
+    A list-like collection of rays which are created when first accessed.
+
+    Parameters
+    ----------
+    buf : bytes or mmap
+        Buffer containing the UF file.
+    record_offsets : array
+        Offset in bytes of each record in the buffer.
+    header_tables : tuple of arrays
+        Mandatory headers, data headers, field positions, field headers and
+        field_has_nyquist of each record.  The headers of each ray are views
+        into these.
+    field_filter : callable or None
+        Field filter passed to each UFRay.
+
+    """
+
+    def __init__(self, buf, record_offsets, header_tables, field_filter=None):
+        """ initialize. """
+        self._view = memoryview(buf)
+        self._record_offsets = record_offsets
+        self._record_sizes = _byte_size(header_tables[0]['record_length'])
+        self._header_tables = header_tables
+        self._field_filter = field_filter
+        self._rays = [None] * len(record_offsets)
+
+    def __len__(self):
+        return len(self._rays)
+
+    def _extend(self, buf, record_offsets, header_tables):
+        """ Extend the list with records appended to the buffer. """
+        nrays = len(record_offsets) - len(self._rays)
+        self._view = memoryview(buf)
+        self._record_offsets = record_offsets
+        self._record_sizes = _byte_size(header_tables[0]['record_length'])
+        self._header_tables = header_tables
+        self._rays.extend([None] * nrays)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        ray = self._rays[index]
+        if ray is None:
+            ray = self._create_ray(index)
+            self._rays[index] = ray
+        return ray
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def _create_ray(self, index):
+        """ Create a UFRay from a record and its rows of the header tables. """
+        start = self._record_offsets[index]
+        end = start + self._record_sizes[index]
+        headers = tuple(table[index] for table in self._header_tables)
+        return UFRay(self._view[start:end], self._field_filter, headers)
 
 
 class UFRay(object):
@@ -218,127 +926,924 @@ class UFRay(object):
 
     Parameters
     ----------
-    record : str
-        Byte string containing the binary data for a UF ray.
+    record : bytes or memoryview
+        Buffer containing the binary data for a UF ray.
+    field_filter : callable, optional
+        Function called with the data type of each field in the ray, as a
+        str, data from fields for which a false value is returned is not
+        read.  None, the default, will read all fields.
+    headers : tuple, optional
+        Mandatory header, data header, field positions, field headers and
+        field_has_nyquist of the ray when these have already been decoded,
+        for example the rows of the header tables of a UFFile.  None, the
+        default, will decode the headers from the record.
 
     Attributes
     ----------
-    mandatory_header : dic
+    mandatory_header : dict-like
         Mandatory header.
-    optional_header : dic or None
+    optional_header : dict-like or None
         Optional header or None if no optional header exists in the record.
-    data_header : dic
+    data_header : dict-like
         Data header.
     field_positions : list
-        List of dictionaries containing the data type and data position.
+        List of dict-like objects containing the data type and data
+        position.
     field_headers : list
-        List of field header dictionaries for all fields in the ray.
+        List of field header dict-like objects for all fields in the ray.
+        The nyquist velocity is only present in the headers of fields with
+        a velocity header.
+
+    The headers are views of records, typically rows of the header tables
+    of a UFFile, elements changed in the headers are changed in the tables.
     field_raw_data : list
-        List containing array of raw field data for each field in the ray.
-    _buf : str
-        Bytes which make up the record.
+        List containing array of raw field data for each field in the ray,
+        None for fields excluded by the field filter.
+    _buf : bytes or memoryview
+        Buffer holding the bytes which make up the record.
 
     """
 
-    def __init__(self, record):
+    # rays hold their headers as views of records which are typically rows
+    # of the header tables of a UFFile, slots avoid a per-ray dictionary.
+    __slots__ = ('_buf', 'mandatory_header', 'optional_header',
+                 'data_header', 'field_positions', 'field_headers',
+                 'field_raw_data')
+
+    def __init__(self, record, field_filter=None, headers=None):
         """ Initalize the object. """
 
         self._buf = record
 
-        # read in the mandatory header
-        self.mandatory_header = _unpack_from_buf(
-            self._buf, 0, UF_MANDATORY_HEADER)
+        # read in the mandatory, data and field headers along with the field
+        # position information
+        if headers is None:
+            record_offsets = np.zeros((1, ), dtype='int64')
+            mandatory_headers = _unpack_table(
+                record, record_offsets, UF_MANDATORY_HEADER_DTYPE)
+            tables = _decode_headers(record, record_offsets, mandatory_headers)
+            headers = (tables['mandatory_headers'][0],
+                       tables['data_headers'][0],
+                       tables['field_positions'][0],
+                       tables['field_headers'][0],
+                       tables['field_has_nyquist'][0])
+        (mandatory_header, data_header, field_positions, field_headers,
+         field_has_nyquist) = headers
+        self.mandatory_header = _HeaderRecord(mandatory_header)
+        self.data_header = _HeaderRecord(data_header)
+        self.field_positions = [
+            _HeaderRecord(position) for position in field_positions]
+        self.field_headers = [
+            _HeaderRecord(field_header, field_has_nyquist, i)
+            for i, field_header in enumerate(field_headers)]
 
         # read in optional header (if present)
         self.optional_header = None
         if self.mandatory_header['offset_optional_header'] != 0:
-            offset = (self.mandatory_header['offset_optional_header'] - 1) * 2
-            self.optional_header = _unpack_from_buf(
-                self._buf, offset, UF_OPTIONAL_HEADER)
-
-        # read in data header
-        offset = (self.mandatory_header['offset_data_header'] - 1) * 2
-        self.data_header = _unpack_from_buf(self._buf, offset, UF_DATA_HEADER)
-
-        # read in field position information
-        self.field_positions = [
-            _unpack_from_buf(self._buf, offset + 6 + i*4, UF_FIELD_POSITION)
-            for i in range(self.data_header['record_nfields'])]
-
-        # read field headers and data
-        self.field_headers = []
-        self.field_raw_data = [self.get_field_data(i) for i in
-                               range(self.data_header['record_nfields'])]
-
-        return
+            offset = _byte_offset(
+                self.mandatory_header['offset_optional_header'])
+            self.optional_header = _HeaderRecord(_unpack_table(
+                record, offset, UF_OPTIONAL_HEADER_DTYPE)[()])
+
+        # read field data
+        self.field_raw_data = []
+        for i, position in enumerate(self.field_positions):
+            data_type = _data_type_str(position['data_type'])
+            if field_filter is None or field_filter(data_type):
+                self.field_raw_data.append(self.get_field_data(i))
+            else:
+                self.field_raw_data.append(None)
 
     def get_field_data(self, field_number):
-        """
-        Return array of raw data for a particular field in the ray.
-
-        Field header is appended to the list in the field_headers attribute.
-        """
-        position = self.field_positions[field_number]
-        offset = (position['offset_field_header'] - 1) * 2
-        field_header = _unpack_from_buf(self._buf, offset, UF_FIELD_HEADER)
-        self.field_headers.append(field_header)
-        data_offset = (field_header['data_offset'] - 1) * 2
-
-        # read in field specific parameters
-        if position['data_type'] in ['VF', 'VE', 'VR', 'VT', 'VP']:
-            if (data_offset - offset) == 42:
-                vel_header = _unpack_from_buf(self._buf, offset+38, UF_FSI_VEL)
-                field_header.update(vel_header)
-
-        data_str = self._buf[data_offset:data_offset+field_header['nbins']*2]
-        raw_data = np.fromstring(data_str, dtype='>i2')
+        """ Return array of raw data for a particular field in the ray. """
+        field_header = self.field_headers[field_number]
+        data_offset = int(_byte_offset(field_header['data_offset']))
+        nbytes = int(field_header['nbins']) * 2
+        data_str = self._buf[data_offset:data_offset + nbytes]
+        raw_data = np.frombuffer(data_str, dtype='>i2')
         return raw_data
 
     def get_datetime(self):
         """ Return a datetime object for the ray. """
-        year = self.mandatory_header['year']
-        if year < 1900:
-            year += 2000   # years after 2000, 11 -> 2011
-        month = self.mandatory_header['month']
-        day = self.mandatory_header['day']
-        hour = self.mandatory_header['hour']
-        minute = self.mandatory_header['minute']
-        second = self.mandatory_header['second']
-        return datetime.datetime(year, month, day, hour, minute, second)
+        return _header_datetime(self.mandatory_header)
 
     def get_location(self):
         """ Return the latitude, longitude and height of the ray. """
-        lat_deg = self.mandatory_header['latitude_degrees']
-        lat_min = self.mandatory_header['latitude_minutes']
-        lat_sec = self.mandatory_header['latitude_seconds'] / 64.
-        latitude = lat_deg + (lat_min + lat_sec / 60.) / 60.
+        return _header_location(self.mandatory_header)
+
+
+class _HeaderRecord(MutableMapping):
+    """
+    A dictionary-like view of a header record.
+
+    Elements are read from and written to the record, elements cannot be
+    added or removed except for the nyquist velocity header of a field
+    header, which is present when has_nyquist is True for the field.
+
+    Parameters
+    ----------
+    record : record
+        Header record, typically a row of a header table of a UFFile.
+    has_nyquist : array, optional
+        Row of the field_has_nyquist table for a field header, None for
+        other headers.
+    field_number : int, optional
+        Index of the field in has_nyquist.
+
+    """
+
+    __slots__ = ('_record', '_has_nyquist', '_field_number')
+
+    def __init__(self, record, has_nyquist=None, field_number=None):
+        """ initialize. """
+        self._record = record
+        self._has_nyquist = has_nyquist
+        self._field_number = field_number
+
+    def _names(self):
+        """ Return the names of the elements present in the header. """
+        names = self._record.dtype.names
+        if (self._has_nyquist is not None and
+                not self._has_nyquist[self._field_number]):
+            names = tuple(
+                name for name in names if name not in _FSI_VEL_NAMES)
+        return names
+
+    def __getitem__(self, name):
+        if name not in self._names():
+            raise KeyError(name)
+        return self._record[name]
+
+    def __setitem__(self, name, value):
+        if self._has_nyquist is not None and name in _FSI_VEL_NAMES:
+            self._has_nyquist[self._field_number] = True
+        elif name not in self._names():
+            raise KeyError(name)
+        self._record[name] = value
+
+    def __delitem__(self, name):
+        if name not in self._names():
+            raise KeyError(name)
+        if self._has_nyquist is None or name not in _FSI_VEL_NAMES:
+            raise TypeError('%s cannot be removed from the header' % (name))
+        # the nyquist velocity header is removed as a whole
+        self._has_nyquist[self._field_number] = False
+
+    def __iter__(self):
+        return iter(self._names())
+
+    def __len__(self):
+        return len(self._names())
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+def iter_uf_rays(filename, field_filter=None):
+    """
+    Iterate over the rays in a UF file.
+
+    Records are read from the file one at a time and converted into UFRay
+    objects as they are reached, the full list of rays is never held in
+    memory.
+
+    Gzip and bzip2 compressed files are decompressed as the records are
+    read.  Compression is detected when a filename or a seekable file-like
+    object is provided.
+
+    Parameters
+    ----------
+    filename : str or file-like
+        Filename or file-like object containing data in Universal format (UF).
+    field_filter : callable, optional
+        Function called with the data type of each field, as a str, data
+        from fields for which a false value is returned is not read.  None,
+        the default, will read all fields.
+
+    Yields
+    ------
+    ray : UFRay
+        Ray from the UF file.
 
-        lon_deg = self.mandatory_header['longitude_degrees']
-        lon_min = self.mandatory_header['longitude_minutes']
-        lon_sec = self.mandatory_header['longitude_seconds'] / 64.
-        longitude = lon_deg + (lon_min + lon_sec / 60.) / 60.
+    """
+    if hasattr(filename, 'read'):
+        raw_fobj = filename
+        close_fobj = False
+    else:
+        raw_fobj = open(filename, 'rb')
+        close_fobj = True
+    fobj = raw_fobj
+    try:
+        compression = None
+        if close_fobj or (hasattr(fobj, 'seekable') and fobj.seekable()):
+            position = fobj.tell()
+            compression = _get_compression(fobj.read(3))
+            fobj.seek(position)
+        if compression == 'gzip':
+            fobj = gzip.GzipFile(fileobj=raw_fobj, mode='rb')
+        elif compression == 'bz2':
+            fobj = bz2.BZ2File(raw_fobj, mode='rb')
+        for record in _read_records(fobj):
+            yield UFRay(record, field_filter)
+    finally:
+        # the decompressing wrappers do not close the file they read from
+        if fobj is not raw_fobj:
+            fobj.close()
+        if close_fobj:
+            raw_fobj.close()
 
-        height = self.mandatory_header['height_above_sea_level']
 
-        return latitude, longitude, height
+def read_uf_arrays(filename, fields=None, sweeps=None,
+                   fixed_angle_range=None, index_file=None, stats=None,
+                   recover=False):
+    """
+    Read a UF file into a lightweight volume of NumPy arrays.
 
+    Only NumPy is required, the volume is returned as a UFVolume object
+    rather than a Py-ART Radar object.
 
-def _structure_size(structure):
-    """ Find the size of a structure in bytes. """
-    return struct.calcsize('>' + ''.join([i[1] for i in structure]))
+    Parameters
+    ----------
+    filename : str or file-like
+        Filename or file-like object containing data in Universal format (UF).
+    fields : list of str, optional
+        UF data types of the fields to read.  None, the default, reads all
+        fields.
+    sweeps, fixed_angle_range, index_file, stats, recover : optional
+        Sweep selection, index file, statistics and recovery of corrupted
+        files, see :py:class:`UFFile`.
+
+    Returns
+    -------
+    volume : UFVolume
+        Volume read from the file.
 
+    """
+    field_filter = None
+    if fields is not None:
+        def field_filter(data_type):
+            return data_type in fields
+    ufile = UFFile(filename, sweeps=sweeps,
+                   fixed_angle_range=fixed_angle_range,
+                   field_filter=field_filter, index_file=index_file,
+                   stats=stats, recover=recover)
+    return UFVolume(ufile)
+
+
+def write_uf_records(filename, mandatory_headers, data_types, field_headers,
+                     raw_data, padding=4):
+    """
+    Write rays to a UF file.
 
-def _unpack_from_buf(buf, pos, structure):
-    """ Unpack a structure from a buffer. """
-    size = _structure_size(structure)
-    return _unpack_structure(buf[pos:pos + size], structure)
+    All records are encoded at once using a NumPy structured array, as such
+    every ray must contain the same fields and number of gates.  The record
+    length, header offsets, field positions and the data_offset and nbins
+    field header elements are determined by this function and need not be
+    set by the caller.
 
+    Parameters
+    ----------
+    filename : str or file-like
+        Filename or file-like object to write the UF data to.
+    mandatory_headers : record array
+        Mandatory header of each ray, dtype UF_MANDATORY_HEADER_DTYPE.
+    data_types : list of str
+        Two character data type of each field, a ValueError is raised if a
+        data type is not two ASCII characters or is repeated.
+    field_headers : record array
+        Field header of each field in each ray, dimensioned (nrays, nfields)
+        with dtype UF_FIELD_HEADER_VEL_DTYPE.  The nyquist velocity and
+        spare elements are only written for velocity fields.
+    raw_data : array
+        Raw (scaled) field data, dimensioned (nfields, nrays, ngates).  The
+        size of each record may not exceed 65534 bytes.
+    padding : 0, 2 or 4
+        Size of the padding in bytes written before and after each record,
+        the padding contains the size of the record in bytes.
 
-def _unpack_structure(string, structure):
-    """ Unpack a structure from a string """
-    fmt = '>' + ''.join([i[1] for i in structure])  # UF is big-endian
-    lst = struct.unpack(fmt, string)
-    return dict(zip([i[0] for i in structure], lst))
+    """
+    nfields, nrays, ngates = raw_data.shape
+    data_types = np.array(_check_data_types(data_types), dtype='S2')
+    is_velocity = np.isin(data_types, _VELOCITY_DATA_TYPES)
+
+    # define the layout of a record, identical for all rays
+    padding_dtype = {0: None, 2: '>i2', 4: '>i4'}[padding]
+    record_dtype = []
+    if padding_dtype is not None:
+        record_dtype.append(('leading_padding', padding_dtype))
+    record_dtype.extend([
+        ('mandatory_header', UF_MANDATORY_HEADER_DTYPE),
+        ('data_header', UF_DATA_HEADER_DTYPE),
+        ('field_positions', UF_FIELD_POSITION_DTYPE, (nfields, )),
+    ])
+    header_dtypes = []
+    for i in range(nfields):
+        if is_velocity[i]:
+            header_dtypes.append(UF_FIELD_HEADER_VEL_DTYPE)
+        else:
+            header_dtypes.append(UF_FIELD_HEADER_DTYPE)
+        record_dtype.append(('field_header_%d' % (i), header_dtypes[i]))
+        record_dtype.append(('field_data_%d' % (i), '>i2', (ngates, )))
+    if padding_dtype is not None:
+        record_dtype.append(('trailing_padding', padding_dtype))
+    record_dtype = np.dtype(record_dtype)
+    records = np.zeros((nrays, ), dtype=record_dtype)
+
+    # word offsets (1-based) to each part of the record
+    def word_offset(name):
+        return (record_dtype.fields[name][1] - padding) // 2 + 1
+    record_size = record_dtype.itemsize - 2 * padding
+    if record_size > _MAX_RECORD_SIZE:
+        raise ValueError(
+            'records of %d bytes exceed the maximum UF record size of %d '
+            'bytes' % (record_size, _MAX_RECORD_SIZE))
+
+    # mandatory header, no optional or local use headers are written
+    mandatory_header = records['mandatory_header']
+    for name in UF_MANDATORY_HEADER_DTYPE.names:
+        mandatory_header[name] = mandatory_headers[name]
+    mandatory_header['uf_string'] = b'UF'
+    mandatory_header['record_length'] = record_size // 2
+    mandatory_header['offset_optional_header'] = 0
+    mandatory_header['offset_local_use_header'] = word_offset('data_header')
+    mandatory_header['offset_data_header'] = word_offset('data_header')
+
+    # data header and field positions
+    records['data_header']['ray_nfields'] = nfields
+    records['data_header']['ray_nrecords'] = 1
+    records['data_header']['record_nfields'] = nfields
+    field_positions = records['field_positions']
+    field_positions['data_type'] = data_types
+    for i in range(nfields):
+        field_positions['offset_field_header'][:, i] = word_offset(
+            'field_header_%d' % (i))
+
+    # field headers and data
+    for i in range(nfields):
+        field_header = records['field_header_%d' % (i)]
+        for name in header_dtypes[i].names:
+            field_header[name] = field_headers[name][:, i]
+        field_header['data_offset'] = word_offset('field_data_%d' % (i))
+        field_header['nbins'] = ngates
+        records['field_data_%d' % (i)] = raw_data[i]
+
+    if padding_dtype is not None:
+        records['leading_padding'] = record_size
+        records['trailing_padding'] = record_size
+
+    if hasattr(filename, 'write'):
+        filename.write(records.tobytes())
+    else:
+        with open(filename, 'wb') as fobj:
+            records.tofile(fobj)
+
+
+def _read_records(fobj):
+    """
+    Read the records from a file object one at a time.
+
+    A record which is truncated by the end of the file, including its post
+    record padding, is not returned, as in _scan_records.
+    """
+    # determine padding around records
+    buf = fobj.read(8)
+    padding = _find_padding(buf)
+
+    while len(buf) == 8:  # read until EOF reached
+
+        record_size = _record_size(buf, padding)
+
+        # read in full record and the post record padding
+        bytes_read = len(buf) - padding
+        bytes_to_read = record_size - bytes_read
+        record = buf[padding:] + fobj.read(bytes_to_read)
+        post_padding = fobj.read(padding)
+        if len(record) != record_size or len(post_padding) != padding:
+            break
+        yield record
+
+        # read in the first eight bytes of the next record
+        buf = fobj.read(8)
+
+
+def _data_type_str(data_type):
+    """ Return a UF data type or name, stored as bytes, as a str. """
+    if not isinstance(data_type, str):
+        data_type = data_type.decode('ascii')
+    return data_type
+
+
+def _check_data_types(data_types):
+    """
+    Return a list of UF data types as bytes.
+
+    Raises a ValueError if a data type is not two ASCII characters or if a
+    data type is repeated.
+    """
+    checked = []
+    for data_type in data_types:
+        try:
+            encoded = _data_type_str(data_type).encode('ascii')
+        except (AttributeError, UnicodeError):
+            encoded = None
+        if encoded is None or len(encoded) != 2:
+            raise ValueError(
+                'invalid UF data type: %r, data types must be two ASCII '
+                'characters' % (data_type, ))
+        if encoded in checked:
+            raise ValueError('repeated UF data type: %r' % (data_type, ))
+        checked.append(encoded)
+    return checked
+
+
+def _get_compression(magic):
+    """ Return the compression, 'gzip', 'bz2' or None, from magic bytes. """
+    magic = bytes(magic[:3])
+    for compression, compression_magic in _COMPRESSION_MAGIC:
+        if magic.startswith(compression_magic):
+            return compression
+    return None
+
+
+def _decompress(fobj, compression, stop=None, head=b''):
+    """
+    Decompress gzip or bzip2 compressed data from a file object.
+
+    The compressed data is read and decompressed in chunks, concatenated
+    streams are decompressed in turn.  Decompression ends once at least stop
+    bytes have been decompressed, None decompresses all of the data.  head
+    is compressed data already read from the file object, for example to
+    detect the compression.  Returns a bytearray.
+    """
+    buf = bytearray()
+    decompressor = _create_decompressor(compression)
+    data = head
+    while stop is None or len(buf) < stop:
+        if decompressor.eof:
+            data = decompressor.unused_data
+            decompressor = _create_decompressor(compression)
+        if not data:
+            data = fobj.read(_DECOMPRESS_CHUNK_SIZE)
+        if not data:
+            break
+        buf += decompressor.decompress(data)
+        data = b''
+    return buf
+
+
+def _create_decompressor(compression):
+    """ Return a decompressor object for a compression. """
+    if compression == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    return bz2.BZ2Decompressor()
+
+
+def _selected_records_end(index, sweeps, fixed_angle_range):
+    """ Return the offset of the end of the last selected record. """
+    selected = _select_sweeps(
+        index['mandatory_headers'], sweeps, fixed_angle_range)
+    if not selected.any():
+        return 0
+    record_offsets = index['record_offsets'][selected]
+    record_sizes = _byte_size(
+        index['mandatory_headers']['record_length'][selected])
+    return int((record_offsets + record_sizes).max() + index['padding'])
+
+
+def _find_padding(buf):
+    """
+    Return the size of the padding around each record in bytes.
+
+    The padding is determined from the position of the 'UF' string in the
+    first eight bytes of the file.
+    """
+    padding = bytes(buf[:8]).find(b'UF')
+    if padding == -1:
+        raise IOError('file in not a valid UF file')
+    return padding
+
+
+def _record_size(buf, record_start):
+    """ Return the size in bytes of the record starting at an offset. """
+    # record size stored as a 2-byte int start at byte 2
+    return struct.unpack_from('>h', buf, record_start + 2)[0] * 2
+
+
+def _scan_records(buf, padding, pos=0):
+    """
+    Find the offset of each record in a buffer.
+
+    Only the record_length of each record is read.  Returns a list of record
+    offsets and the position in the buffer after the last record.  A record
+    which extends beyond the end of the buffer, for example one which is
+    still being written, is not included.
+    """
+    record_offsets = []
+    while pos + 8 <= len(buf):  # read until EOF reached
+
+        record_start = pos + padding
+        record_size = _record_size(buf, record_start)
+        if record_size <= 0:
+            raise IOError(
+                'invalid record_length at byte %d, use recover=True to skip '
+                'corrupted records' % (record_start))
+        record_end = record_start + record_size + padding
+        if record_end > len(buf):
+            break
+        record_offsets.append(record_start)
+
+        # skip post record padding
+        pos = record_end
+    return record_offsets, pos
+
+
+def _recover_padding(buf):
+    """
+    Return the size of the padding around records in a corrupted file.
+
+    The padding is determined from the first valid record, padding which
+    contains the record size is preferred.
+    """
+    record_start = buf.find(b'UF')
+    while record_start != -1:
+        for padding in (4, 2, 0):
+            pos = record_start - padding
+            if pos >= 0 and _valid_record_end(buf, padding, pos) is not None:
+                return padding
+        record_start = buf.find(b'UF', record_start + 1)
+    raise IOError('file contains no valid UF records')
+
+
+def _recover_records(buf, padding, pos=0):
+    """
+    Find the offset of each valid record in a buffer, skipping bad data.
+
+    After data which is not a valid record the buffer is searched for the
+    next 'UF' string which starts a valid record.  Returns a list of record
+    offsets, the position in the buffer after the last record and a list of
+    (start, end) byte ranges which were skipped.  Data at the end of the
+    buffer which is skipped, for example a partially written record, is
+    reported and the returned position is the start of this data.
+    """
+    record_offsets = []
+    skipped_ranges = []
+    skip_start = None
+    while pos + 8 <= len(buf):
+        record_end = _valid_record_end(buf, padding, pos)
+        if record_end is None:
+            if skip_start is None:
+                skip_start = pos
+            record_start = buf.find(b'UF', pos + padding + 1)
+            if record_start == -1:
+                break
+            pos = record_start - padding
+            continue
+        if skip_start is not None:
+            skipped_ranges.append((skip_start, pos))
+            skip_start = None
+        record_offsets.append(pos + padding)
+        pos = record_end
+    if skip_start is not None:
+        pos = skip_start
+    if pos < len(buf):
+        skipped_ranges.append((pos, len(buf)))
+    return record_offsets, pos, skipped_ranges
+
+
+def _valid_record_end(buf, padding, pos):
+    """
+    Return the position after a record when it is valid, otherwise None.
+
+    The record must start with 'UF', contain at least a mandatory header
+    and lie within the buffer.  Padding around the record must contain the
+    size of the record in bytes.  Without padding the record must be
+    followed by another record or be the last record in the buffer.
+    """
+    record_start = pos + padding
+    if bytes(buf[record_start:record_start + 2]) != b'UF':
+        return None
+    record_size = _record_size(buf, record_start)
+    record_end = record_start + record_size + padding
+    if (record_size < UF_MANDATORY_HEADER_DTYPE.itemsize or
+            record_end > len(buf)):
+        return None
+    if padding:
+        fmt = {2: '>H', 4: '>I'}[padding]
+        leading = struct.unpack_from(fmt, buf, pos)[0]
+        trailing = struct.unpack_from(fmt, buf, record_end - padding)[0]
+        if leading != record_size or trailing != record_size:
+            return None
+    elif (bytes(buf[record_end:record_end + 2]) != b'UF' and
+            buf.find(b'UF', record_end) != -1):
+        return None
+    return record_end
+
+
+def _drop_invalid_records(buf, padding, record_offsets, mandatory_headers,
+                          skipped_ranges):
+    """
+    Remove records whose headers do not lie within the record.
+
+    The data header, field positions, field headers and field data of each
+    record are checked as whole table operations, records with a different
+    number of fields than the first record are also removed.  Returns the
+    remaining record offsets and mandatory headers and the sorted skipped
+    byte ranges including the removed records.
+    """
+    mh = mandatory_headers
+    nrecords = len(record_offsets)
+    record_sizes = _byte_size(mh['record_length'])
+    data_header_offsets = _byte_offset(mh['offset_data_header'])
+    valid = ((data_header_offsets >= 0) &
+             (data_header_offsets + UF_DATA_HEADER_DTYPE.itemsize <=
+              record_sizes))
+
+    # number of fields and their positions
+    data_headers = np.zeros((nrecords, ), dtype=UF_DATA_HEADER_DTYPE)
+    data_headers[valid] = _unpack_table(
+        buf, record_offsets[valid] + data_header_offsets[valid],
+        UF_DATA_HEADER_DTYPE)
+    record_nfields = data_headers['record_nfields'].astype('int64')
+    nfields = 0
+    if valid.any():
+        nfields = record_nfields[np.argmax(valid)]
+    valid &= (record_nfields == nfields) & (nfields > 0)
+    valid &= data_header_offsets + 6 + nfields * 4 <= record_sizes
+    position_offsets = (record_offsets[valid] + data_header_offsets[valid] +
+                        6)[:, np.newaxis] + np.arange(nfields) * 4
+    field_positions = _unpack_table(
+        buf, position_offsets, UF_FIELD_POSITION_DTYPE)
+
+    # field headers and data
+    sizes = record_sizes[valid][:, np.newaxis]
+    header_offsets = _byte_offset(field_positions['offset_field_header'])
+    headers_valid = np.all(
+        (header_offsets >= 0) &
+        (header_offsets + UF_FIELD_HEADER_DTYPE.itemsize <= sizes), axis=1)
+    field_headers = np.zeros(header_offsets.shape, UF_FIELD_HEADER_DTYPE)
+    field_headers[headers_valid] = _unpack_table(
+        buf, record_offsets[valid][headers_valid, np.newaxis] +
+        header_offsets[headers_valid], UF_FIELD_HEADER_DTYPE)
+    data_offsets = _byte_offset(field_headers['data_offset'])
+    data_ends = data_offsets + _byte_size(field_headers['nbins'])
+    headers_valid &= np.all(
+        (data_offsets >= 0) & (field_headers['nbins'] >= 0) &
+        (data_ends <= sizes), axis=1)
+    valid[valid] = headers_valid
+
+    starts = record_offsets[~valid] - padding
+    ends = record_offsets[~valid] + record_sizes[~valid] + padding
+    skipped_ranges = _merge_ranges(
+        list(skipped_ranges) + list(zip(starts.tolist(), ends.tolist())))
+    return record_offsets[valid], mandatory_headers[valid], skipped_ranges
+
+
+def _merge_ranges(ranges):
+    """ Return a sorted list of (start, end) ranges with adjacent merged. """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _decode_headers(buf, record_offsets, mandatory_headers):
+    """
+    Decode the data and field headers of each record.
+
+    Returns a dictionary of the header tables which can be saved in an
+    index file.
+    """
+    # The order and number of the fields must be identical between rays,
+    # an IOError is raised otherwise, as the field layout of the first ray
+    # is used to decode the field positions and headers of every ray.
+    offsets = record_offsets
+    mh = mandatory_headers
+    data_header_offsets = offsets + _byte_offset(mh['offset_data_header'])
+    data_headers = _unpack_table(
+        buf, data_header_offsets, UF_DATA_HEADER_DTYPE)
+
+    nfields = 0
+    if len(data_headers):
+        nfields = data_headers['record_nfields'][0]
+    if np.any(data_headers['record_nfields'] != nfields):
+        raise IOError(
+            'rays contain different numbers of fields, use iter_uf_rays to '
+            'read rays with their own field layout')
+    position_offsets = (data_header_offsets[:, np.newaxis] + 6 +
+                        np.arange(nfields) * 4)
+    field_positions = _unpack_table(
+        buf, position_offsets, UF_FIELD_POSITION_DTYPE)
+    data_types = field_positions['data_type']
+    if np.any(data_types != data_types[:1]):
+        raise IOError(
+            'rays contain fields in different orders, use iter_uf_rays to '
+            'read rays with their own field layout')
+
+    # the field headers of velocity fields may be followed by a field
+    # specific velocity header containing the nyquist velocity, this is
+    # decoded for all fields and masked using field_has_nyquist.
+    header_offsets = _byte_offset(field_positions['offset_field_header'])
+    field_headers = _unpack_table(
+        buf, offsets[:, np.newaxis] + header_offsets,
+        UF_FIELD_HEADER_VEL_DTYPE)
+    data_offsets = _byte_offset(field_headers['data_offset'])
+    is_velocity = np.isin(field_positions['data_type'], _VELOCITY_DATA_TYPES)
+    field_has_nyquist = is_velocity & ((data_offsets - header_offsets) == 42)
+    field_headers['nyquist'][~field_has_nyquist] = 0
+    field_headers['spare'][~field_has_nyquist] = 0
+
+    first_ray_in_sweep, last_ray_in_sweep = _sweep_limits(
+        mandatory_headers['sweep_number'])
+    return {
+        'record_offsets': record_offsets,
+        'mandatory_headers': mandatory_headers,
+        'data_headers': data_headers,
+        'field_positions': field_positions,
+        'field_headers': field_headers,
+        'field_has_nyquist': field_has_nyquist,
+        'first_ray_in_sweep': first_ray_in_sweep,
+        'last_ray_in_sweep': last_ray_in_sweep,
+    }
+
+
+def _sweep_limits(ray_sweep_numbers):
+    """ Return arrays of indices of first and last ray in each sweep. """
+    _, first_ray_in_sweep = np.unique(ray_sweep_numbers, return_index=True)
+    _, reversed_index = np.unique(ray_sweep_numbers[::-1], return_index=True)
+    last_ray_in_sweep = len(ray_sweep_numbers) - 1 - reversed_index
+    return (first_ray_in_sweep.astype('int32'),
+            last_ray_in_sweep.astype('int32'))
+
+
+def _merge_sweep_limits(ray_sweep_numbers, first_ray_in_sweep,
+                        last_ray_in_sweep, new_ray_sweep_numbers,
+                        new_first_ray_in_sweep, new_last_ray_in_sweep):
+    """
+    Return the sweep limits after rays are appended to a volume.
+
+    The limits of the appended rays must be offset by the number of rays
+    already in the volume.
+    """
+    nrays = len(ray_sweep_numbers)
+    sweep_numbers = np.concatenate([
+        ray_sweep_numbers[first_ray_in_sweep],
+        new_ray_sweep_numbers[new_first_ray_in_sweep - nrays]])
+    first = np.concatenate([first_ray_in_sweep, new_first_ray_in_sweep])
+    last = np.concatenate([last_ray_in_sweep, new_last_ray_in_sweep])
+    _, first_index = np.unique(sweep_numbers, return_index=True)
+    _, reversed_index = np.unique(sweep_numbers[::-1], return_index=True)
+    return (first[first_index].astype('int32'),
+            last[::-1][reversed_index].astype('int32'))
+
+
+def _read_index(index_file, filename):
+    """
+    Read an index file.
+
+    Returns None if the index file does not exist, cannot be read, or the
+    size or modification time of the UF file does not match the index.
+    """
+    if not os.path.exists(index_file):
+        return None
+    stat = os.stat(filename)
+    try:
+        with np.load(index_file) as npz:
+            if (npz['version'] != _INDEX_VERSION or
+                    npz['file_size'] != stat.st_size or
+                    npz['file_mtime'] != stat.st_mtime):
+                return None
+            return dict((name, npz[name]) for name in _INDEX_CONTENTS)
+    except (IOError, OSError, ValueError, KeyError, zipfile.BadZipfile):
+        return None
+
+
+def _write_index(index_file, file_stat, index):
+    """
+    Write an index file, warn if it cannot be written.
+
+    file_stat is the os.stat_result of the UF file when it was read, the
+    index is only valid while the file has the same size and modification
+    time.
+    """
+    contents = dict((name, index[name]) for name in _INDEX_CONTENTS)
+    # write to a temporary file and rename so that readers never see a
+    # partially written index.
+    tmp_file = '%s.%d.tmp' % (index_file, os.getpid())
+    try:
+        with open(tmp_file, 'wb') as fobj:
+            np.savez(fobj, version=_INDEX_VERSION,
+                     file_size=file_stat.st_size,
+                     file_mtime=file_stat.st_mtime, **contents)
+        os.rename(tmp_file, index_file)
+    except (IOError, OSError):
+        warnings.warn('unable to write UF index file: %s' % (index_file))
+
+
+def _select_sweeps(mandatory_headers, sweeps, fixed_angle_range):
+    """ Return a boolean array selecting the rays in the requested sweeps. """
+    ray_sweep_numbers = mandatory_headers['sweep_number']
+    selected = np.ones(len(mandatory_headers), dtype='bool')
+    if len(mandatory_headers) == 0:
+        return selected
+    if sweeps is not None:
+        try:
+            sweep_numbers = np.unique(ray_sweep_numbers)[sweeps]
+        except IndexError:
+            raise ValueError('no rays in the selected sweeps')
+        selected &= np.isin(ray_sweep_numbers, sweep_numbers)
+    if fixed_angle_range is not None:
+        low, high = fixed_angle_range
+        fixed_angles = mandatory_headers['fixed_angle'] / 64.
+        selected &= (fixed_angles >= low) & (fixed_angles <= high)
+    return selected
+
+
+def _check_step(step, name):
+    """ Return a ray or gate step as an int, it must be a positive integer. """
+    try:
+        step = operator.index(step)
+    except TypeError:
+        step = 0
+    if step < 1:
+        raise ValueError('%s must be a positive integer' % (name))
+    return step
+
+
+def _header_datetime(mandatory_header):
+    """ Return a datetime object from a mandatory header. """
+    year = int(mandatory_header['year'])
+    if year < 1900:
+        year += 2000   # years after 2000, 11 -> 2011
+    month = int(mandatory_header['month'])
+    day = int(mandatory_header['day'])
+    hour = int(mandatory_header['hour'])
+    minute = int(mandatory_header['minute'])
+    second = int(mandatory_header['second'])
+    return datetime.datetime(year, month, day, hour, minute, second)
+
+
+def _header_location(mandatory_header):
+    """ Return the latitude, longitude and height from a mandatory header. """
+    mh = mandatory_header
+    lat_deg = mh['latitude_degrees']
+    lat_min = mh['latitude_minutes']
+    lat_sec = mh['latitude_seconds'] / 64.
+    latitude = lat_deg + (lat_min + lat_sec / 60.) / 60.
+
+    lon_deg = mh['longitude_degrees']
+    lon_min = mh['longitude_minutes']
+    lon_sec = mh['longitude_seconds'] / 64.
+    longitude = lon_deg + (lon_min + lon_sec / 60.) / 60.
+
+    height = mh['height_above_sea_level']
+
+    return latitude, longitude, height
+
+
+def _header_datetime64(mandatory_headers):
+    """ Return an array of datetime64[s] times from mandatory headers. """
+    mh = mandatory_headers
+    year = mh['year'].astype('int64')
+    year[year < 1900] += 2000   # years after 2000, 11 -> 2011
+    months = (year - 1970) * 12 + mh['month'] - 1
+    days = (months.astype('datetime64[M]').astype('datetime64[D]') +
+            (mh['day'].astype('int64') - 1))
+    seconds = (mh['hour'].astype('int64') * 3600 +
+               mh['minute'].astype('int64') * 60 +
+               mh['second'].astype('int64'))
+    return days.astype('datetime64[s]') + seconds.astype('timedelta64[s]')
+
+
+def _byte_offset(word_offset):
+    """ Convert 1-based offsets in 16-bit words to 0-based byte offsets. """
+    return (np.asarray(word_offset, dtype='int64') - 1) * 2
+
+
+def _byte_size(word_size):
+    """ Convert sizes in 16-bit words to sizes in bytes. """
+    return np.asarray(word_size, dtype='int64') * 2
+
+
+def _structure_dtype(structure):
+    """ Return a NumPy dtype equivalent to a structure. """
+    dtype = []
+    for name, fmt in structure:
+        if fmt.endswith('s'):
+            dtype.append((name, 'S' + fmt[:-1]))
+        else:
+            dtype.append((name, '>' + fmt))     # UF is big-endian
+    return np.dtype(dtype)
+
+
+def _unpack_table(buf, offsets, dtype):
+    """ Unpack a structure at each offset in a buffer into a record array. """
+    offsets = np.asarray(offsets)
+    byte_buf = np.frombuffer(buf, dtype='u1')
+    index = offsets[..., np.newaxis] + np.arange(dtype.itemsize)
+    return byte_buf[index].view(dtype).reshape(offsets.shape)
 
 
 # The Universal file format was originally described in the report:
@@ -360,6 +1865,8 @@ def _unpack_structure(string, structure):
 
 POLARIZATION_STR = ['horizontal', 'vertical', 'circular', 'elliptical']
 
+_VELOCITY_DATA_TYPES = [b'VF', b'VE', b'VR', b'VT', b'VP']
+
 INT16 = 'h'
 
 UF_MANDATORY_HEADER = (
@@ -460,3 +1967,52 @@ UF_FSI_DM = (
     ('antenna_gain', INT16),
     ('pulse_duration', INT16),
 )
+
+# Header tables of a UFFile, these along with the padding and sweep limits are
+# stored in index files.
+_HEADER_TABLES = (
+    'record_offsets',
+    'mandatory_headers',
+    'data_headers',
+    'field_positions',
+    'field_headers',
+    'field_has_nyquist',
+)
+_INDEX_CONTENTS = _HEADER_TABLES + (
+    'padding', 'first_ray_in_sweep', 'last_ray_in_sweep', 'skipped_ranges')
+_INDEX_VERSION = 2
+
+# record_length is a signed 16-bit count of 2-byte words
+_MAX_RECORD_SIZE = 32767 * 2
+
+# stages recorded by ReadStats, in the order they are performed
+_STAT_STAGES = [
+    'index read',
+    'decompression',
+    'record scan',
+    'header decode',
+    'field decode',
+    'field scaling',
+    'time conversion',
+    'radar construction',
+]
+
+# magic bytes of the supported compression formats, compressed data is
+# decompressed in chunks of _DECOMPRESS_CHUNK_SIZE bytes.
+_COMPRESSION_MAGIC = (
+    ('gzip', b'\x1f\x8b'),
+    ('bz2', b'BZh'),
+)
+_DECOMPRESS_CHUNK_SIZE = 2 ** 20
+
+# NumPy dtypes of the structures, used to decode the headers of all rays in
+# a volume in a single pass.
+UF_MANDATORY_HEADER_DTYPE = _structure_dtype(UF_MANDATORY_HEADER)
+UF_OPTIONAL_HEADER_DTYPE = _structure_dtype(UF_OPTIONAL_HEADER)
+UF_DATA_HEADER_DTYPE = _structure_dtype(UF_DATA_HEADER)
+UF_FIELD_POSITION_DTYPE = _structure_dtype(UF_FIELD_POSITION)
+UF_FIELD_HEADER_DTYPE = _structure_dtype(UF_FIELD_HEADER)
+UF_FIELD_HEADER_VEL_DTYPE = _structure_dtype(UF_FIELD_HEADER + UF_FSI_VEL)
+
+# elements of the field specific velocity header
+_FSI_VEL_NAMES = tuple(name for name, _ in UF_FSI_VEL)
@@ -0,0 +1,251 @@
+"""
+Chunked columnar storage of UF volumes.
+
+A UF file is converted once into a directory of NumPy .npy files which are
+memory mapped when read, a field of a single sweep can be read without
+parsing any UF records or reading the data of other sweeps and fields.
+The directory contains:
+
+* metadata.json : store version, data types and scale factors of the
+  fields and the size of the volume.
+* <table>.npy : header tables of the volume, the mandatory_headers,
+  data_headers, field_positions, field_headers, field_has_nyquist,
+  first_ray_in_sweep and last_ray_in_sweep attributes of the UFFile.
+* sweep_NNN/field_NN.npy : raw int16 data of a field in a sweep,
+  dimensioned (nrays in sweep, ngates) and padded with the missing data
+  value.
+
+Usage::
+
+    python ufstore.py volume.uf volume.ufstore --fields DZ VR
+
+"""
+
+import os
+import json
+import shutil
+import argparse
+
+import numpy as np
+
+from uffile import UFFile, _header_datetime64, _data_type_str
+
+
+_STORE_VERSION = 1
+_STORE_TABLES = (
+    'mandatory_headers',
+    'data_headers',
+    'field_positions',
+    'field_headers',
+    'field_has_nyquist',
+    'first_ray_in_sweep',
+    'last_ray_in_sweep',
+)
+
+
+def convert_uf(filename, directory, overwrite=False, **kwargs):
+    """
+    Convert a UF file into a chunked columnar store.
+
+    Parameters
+    ----------
+    filename : str or file-like
+        Filename or file-like object containing data in Universal format (UF).
+    directory : str
+        Directory in which to create the store.  The store is written to a
+        temporary directory which is renamed once complete so that readers
+        never see a partially written store.
+    overwrite : bool, optional
+        True to replace an existing store.  False, the default, raises an
+        IOError if the directory exists.
+
+    Additional keyword arguments are passed to :py:class:`UFFile`, for
+    example sweeps, field_filter or recover.  Fields excluded by the
+    field_filter are not stored.
+
+    """
+    directory = directory.rstrip(os.sep)
+    if os.path.exists(directory) and not overwrite:
+        raise IOError('%s already exists' % (directory))
+    ufile = UFFile(filename, **kwargs)
+
+    tmp_dir = '%s.%d.tmp' % (directory, os.getpid())
+    os.makedirs(tmp_dir)
+    try:
+        for name in _STORE_TABLES:
+            np.save(os.path.join(tmp_dir, name + '.npy'),
+                    getattr(ufile, name))
+        field_numbers = np.nonzero(ufile.field_is_read)[0]
+        for sweep in range(ufile.nsweeps):
+            os.mkdir(os.path.join(tmp_dir, 'sweep_%03d' % (sweep)))
+            for field_number in field_numbers:
+                np.save(_chunk_path(tmp_dir, sweep, field_number),
+                        ufile.get_sweep_raw_field_data(field_number, sweep))
+
+        metadata = {
+            'version': _STORE_VERSION,
+            'nrays': ufile.nrays,
+            'nsweeps': ufile.nsweeps,
+            'data_types': [_data_type_str(data_type) for data_type in
+                           ufile.field_positions['data_type'][0]],
+            'field_is_stored': ufile.field_is_read.tolist(),
+            'scale_factors':
+                ufile.field_headers['scale_factor'][0].tolist(),
+            'missing_data_value':
+                int(ufile.mandatory_headers['missing_data_value'][0]),
+        }
+        with open(os.path.join(tmp_dir, 'metadata.json'), 'w') as fobj:
+            json.dump(metadata, fobj, indent=2)
+
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.rename(tmp_dir, directory)
+    finally:
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+
+
+class UFStore(object):
+    """
+    A chunked columnar store of a UF volume, created by convert_uf.
+
+    The header tables and field data are memory mapped, only the chunks
+    which are accessed are read from disk.
+
+    Parameters
+    ----------
+    directory : str
+        Directory containing the store.
+
+    Attributes
+    ----------
+    nrays, nsweeps : int
+        Number of rays and sweeps in the volume.
+    data_types : list of str
+        UF data type of each field.
+    field_is_stored : array
+        True for fields whose data is in the store.
+    scale_factors : array
+        Scale factor of each field.
+    missing_data_value : int
+        Raw value of missing gates.
+    mandatory_headers, data_headers : record array
+        Mandatory and data header of each ray.
+    field_positions, field_headers : record array
+        Field positions and field headers of each ray, dimensioned (nrays,
+        nfields).
+    field_has_nyquist : array
+        True when the corresponding field header contains a nyquist
+        velocity.
+    first_ray_in_sweep, last_ray_in_sweep : array
+        Indices of the first and last ray in each sweep.
+
+    """
+
+    def __init__(self, directory):
+        """ initialize. """
+        with open(os.path.join(directory, 'metadata.json')) as fobj:
+            metadata = json.load(fobj)
+        if metadata['version'] != _STORE_VERSION:
+            raise ValueError(
+                'unsupported UF store version: %d' % (metadata['version']))
+        self.directory = directory
+        self.nrays = metadata['nrays']
+        self.nsweeps = metadata['nsweeps']
+        self.data_types = metadata['data_types']
+        self.field_is_stored = np.array(metadata['field_is_stored'])
+        self.scale_factors = np.array(metadata['scale_factors'])
+        self.missing_data_value = metadata['missing_data_value']
+        for name in _STORE_TABLES:
+            table = np.load(os.path.join(directory, name + '.npy'),
+                            mmap_mode='r')
+            setattr(self, name, table)
+
+    def get_sweep_raw_field_data(self, field_number, sweep):
+        """ Return a memory mapped array of raw field data for a sweep. """
+        if not self.field_is_stored[field_number]:
+            raise ValueError('field %d is not in the store' % (field_number))
+        return np.load(_chunk_path(self.directory, sweep, field_number),
+                       mmap_mode='r')
+
+    def get_sweep_field_data(self, field_number, sweep):
+        """ Return a 2D array of scale/masked field data for a sweep. """
+        raw_data = self.get_sweep_raw_field_data(field_number, sweep)
+        return self._scale(raw_data, field_number)
+
+    def get_field_data(self, field_number):
+        """
+        Return a 2D array of scale/masked field data for the volume.
+
+        The number of gates is taken from the first ray, as in
+        UFFile.get_field_data.
+        """
+        ngates = self.field_headers['nbins'][0, field_number]
+        raw_data = np.empty((self.nrays, ngates), dtype='int16')
+        raw_data[:] = self.missing_data_value
+        for sweep in range(self.nsweeps):
+            first = self.first_ray_in_sweep[sweep]
+            last = self.last_ray_in_sweep[sweep]
+            sweep_data = self.get_sweep_raw_field_data(field_number, sweep)
+            nbins = min(ngates, sweep_data.shape[1])
+            raw_data[first:last + 1, :nbins] = sweep_data[:, :nbins]
+        return self._scale(raw_data, field_number)
+
+    def _scale(self, raw_data, field_number):
+        """ Return scaled and masked field data from raw data. """
+        scale_factor = self.scale_factors[field_number]
+        data = np.divide(raw_data, float(scale_factor), dtype='float64')
+        mask = np.equal(raw_data, self.missing_data_value)
+        return np.ma.masked_array(data, mask)
+
+    def get_azimuths(self):
+        """ Return an array of azimuth angles for each ray in degrees. """
+        return (self.mandatory_headers['azimuth'] / 64.).astype('float32')
+
+    def get_elevations(self):
+        """ Return an array of elevation angles for each ray in degrees. """
+        return (self.mandatory_headers['elevation'] / 64.).astype('float32')
+
+    def get_times(self):
+        """ Return an array of datetime64 times for each ray. """
+        return _header_datetime64(self.mandatory_headers)
+
+    def get_sweep_fixed_angles(self):
+        """ Return an array of fixed angles for each sweep in degrees. """
+        fixed = self.mandatory_headers['fixed_angle'][self.first_ray_in_sweep]
+        return (fixed / 64.).astype('float32')
+
+
+def _chunk_path(directory, sweep, field_number):
+    """ Return the path of the chunk holding a field in a sweep. """
+    return os.path.join(directory, 'sweep_%03d' % (sweep),
+                        'field_%02d.npy' % (field_number))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Convert a UF file into a chunked columnar store.')
+    parser.add_argument('filename', help='UF file to convert')
+    parser.add_argument('directory', help='directory of the store')
+    parser.add_argument('--fields', nargs='+', metavar='DATA_TYPE',
+                        help='UF data types of the fields to store, all '
+                        'fields are stored when not provided')
+    parser.add_argument('--sweeps', nargs='+', type=int,
+                        help='indices of the sweeps to store')
+    parser.add_argument('--recover', action='store_true',
+                        help='skip corrupted or truncated records')
+    parser.add_argument('--overwrite', action='store_true',
+                        help='replace an existing store')
+    args = parser.parse_args(argv)
+
+    field_filter = None
+    if args.fields is not None:
+        def field_filter(data_type):
+            return data_type in args.fields
+    convert_uf(args.filename, args.directory, overwrite=args.overwrite,
+               sweeps=args.sweeps, field_filter=field_filter,
+               recover=args.recover)
+
+
+if __name__ == '__main__':
+    main()